@@ -240,6 +240,55 @@ class insertAny:
   def GetResources(self):
     return{'MenuText':'Insert any shape','ToolTip':'Insert a STEP, IGES or BREP'}
 
+class fullDetail:
+  '''
+  Switches the selected pype-lines, branches or pypes back to full detail.
+  '''
+  def Activated(self):
+    import pipeCmd
+    FreeCAD.activeDocument().openTransaction('Full detail')
+    pipeCmd.setLOD(lod='Full')
+    FreeCAD.activeDocument().recompute()
+    FreeCAD.activeDocument().commitTransaction()
+  def GetResources(self):
+    return{'MenuText':'Full detail','ToolTip':'Draw the selected pype-lines with full detail geometry'}
+
+class shapesCache:
+  '''
+  Prints the counters of the caches of shapes and, if confirmed, clears them.
+  '''
+  def Activated(self):
+    import pipeShapes
+    from PySide.QtGui import QMessageBox
+    stats=pipeShapes.cacheStats()
+    disk=stats[-1]
+    msg='Shapes in memory: %i\nFiles on disk: %i (%.1f MB)\nin %s\n\nClear the caches?' %(sum([s['shapes'] for s in stats[:-1]]),disk['files'],disk['size']/1048576.0,disk['path'])
+    if QMessageBox.question(None,'Shapes cache',msg,QMessageBox.Yes|QMessageBox.No)==QMessageBox.Yes:
+      pipeShapes.clearCaches(onDisk=True)
+      FreeCAD.Console.PrintMessage('Shapes cache cleared\n')
+  def GetResources(self):
+    return{'MenuText':'Shapes cache','ToolTip':'Inspect or clear the cache of shapes of pypes'}
+
+class clashCheck:
+  '''
+  Checks the clashes among the selected pypes and beams, or all of them
+  if nothing is selected, and selects the objects found.
+  '''
+  def Activated(self):
+    import pipeClash
+    from PySide.QtGui import QInputDialog
+    clearance,ok=QInputDialog.getDouble(None,'Clash check','Minimum clearance [mm]',0,0,10000,1)
+    if not ok:
+      return
+    objs=FreeCADGui.Selection.getSelection() or None
+    report=pipeClash.clashes(objs,clearance)
+    pipeClash.printReport(report)
+    FreeCADGui.Selection.clearSelection()
+    for name in set([c['a'] for c in report]+[c['b'] for c in report]):
+      FreeCADGui.Selection.addSelection(FreeCAD.ActiveDocument.getObject(name))
+  def GetResources(self):
+    return{'MenuText':'Clash check','ToolTip':'Check interferences and clearances among pypes and beams'}
+
 #---------------------------------------------------------------------------
 # Adds the commands to the FreeCAD command manager
 #---------------------------------------------------------------------------
@@ -263,3 +312,6 @@ addCommand('laydown',laydown())
 addCommand('raiseup',raiseup())
 addCommand('point2point',point2point())
 addCommand('insertAny',insertAny())
+addCommand('fullDetail',fullDetail())
+addCommand('shapesCache',shapesCache())
+addCommand('clashCheck',clashCheck())
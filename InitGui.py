@@ -120,9 +120,13 @@ static char * image[] =
     self.appendToolbar("frameTools",list4)
     Log ('Loading Frame tools: done\n')
     import CommandsPipe
-    list5=["insertPipe","insertElbow","insertReduct","insertCap","insertValve","insertFlange","insertUbolt","insertPypeLine","insertBranch","breakPipe","mateEdges","joinPype","flat","extend2intersection","extend1intersection","laydown","raiseup","attach2tube","point2point","insertAny"]
+    list5=["insertPipe","insertElbow","insertReduct","insertCap","insertValve","insertFlange","insertUbolt","insertPypeLine","insertBranch","breakPipe","mateEdges","joinPype","flat","extend2intersection","extend1intersection","laydown","raiseup","attach2tube","point2point","insertAny","fullDetail","shapesCache","clashCheck"]
     self.appendToolbar("pipeTools",list5)
     Log ('Loading Pipe tools: done\n')
+    if FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/flamingo").GetBool('WarmUpCaps',False):
+      import pipeShapes
+      pipeShapes.warmUpCaps()
+      Log ('Building caps: done\n')
     menu1 = ["Frame tools"]
     menu2 = ["Pype tools"]
     menu3 = ["Eagle tools"]
@@ -124,11 +124,8 @@ class shapeDialog(prototypeDialog):
       if isfile(join(self.cwd,n)) and n.upper().split(extsep)[-1] in ['STEP','STP','IGES','IGS','BREP','BRP']:
         self.form.listFiles.addItem(n)
       if n[:4]=='Any_' and n[-4:]=='.csv':
-        f=open(join(self.cwd,n),'r')
-        from csv import DictReader
-        reader=DictReader(f,delimiter=';')
-        self.pipeDictList=[DNx for DNx in reader]
-        f.close()
+        import catalog
+        self.pipeDictList=catalog.getTable(join(self.cwd,n),'fileName').rows
         self.filesListed=[row['fileName'] for row in self.pipeDictList]
     self.form.listFiles.setCurrentRow(0)
   def checkListed(self):
@@ -0,0 +1,113 @@
+#(c) 2018 R. T. LGPL: part of Flamingo tools w.b. for FreeCAD
+
+__title__="pypeTools catalog"
+__author__="oddtopus"
+__url__="github.com/oddtopus/flamingo"
+__license__="LGPL 3"
+__doc__='''
+Catalog of the components defined in the ";"-separated .csv tables.
+Each file is parsed only once and kept in memory until its modification
+time changes: then it's parsed again at the next request.
+Tables of ./tables are named <PType>_<PRating>.csv and their rows are
+indexed by the first column (PSize, or SSize for sections), so that
+    find(PType, PRating, PSize)
+doesn't scan the table.
+Rows are available as in the file (strings, as expected by the dialogs)
+or with the numeric values converted to float (numeric=True).
+'''
+
+import os, csv
+from os.path import join, dirname, abspath
+
+tablesDir=join(dirname(abspath(__file__)),"tables")
+
+class table(object):
+  '''
+  table(path, key=None)
+  The content of one ";"-separated .csv file.
+    path (string): the absolute path of file
+    key (string): the column used to index rows; default the first one
+  Attributes:
+    .rows: list of dictionaries with the values as read in the file
+    .values: the same rows with the numeric values converted to float
+    .index: dictionary {<key value>: <row number>} (the first row wins)
+    .mtime: the modification time of file when it was read
+  '''
+  def __init__(self,path,key=None):
+    self.path=path
+    self.mtime=os.path.getmtime(path)
+    f=open(path,'r')
+    reader=csv.DictReader(f,delimiter=';')
+    self.rows=[row for row in reader]
+    f.close()
+    self.key=key or (reader.fieldnames and reader.fieldnames[0])
+    self.values=[dict([(k,toFloat(v)) for k,v in row.items()]) for row in self.rows]
+    self.index=dict()
+    for i in range(len(self.rows)):
+      self.index.setdefault(self.rows[i].get(self.key),i)
+  def find(self,value,numeric=False):
+    'Returns the first row whose key column is value, or None'
+    i=self.index.get(value)
+    if i is None:
+      return None
+    if numeric:
+      return self.values[i]
+    return self.rows[i]
+
+def toFloat(value):
+  'Returns value as float, if it represents a number, or as it is'
+  try:
+    return float(value)
+  except (TypeError, ValueError):
+    return value
+
+tables=dict()
+
+def getTable(path,key=None):
+  '''
+  getTable(path, key=None)
+  Returns the table of the .csv file path, parsing it only if it's new
+  or it has been modified since it was read.
+  '''
+  path=abspath(path)
+  t=tables.get((path,key))
+  if not t or t.mtime!=os.path.getmtime(path):
+    t=tables[(path,key)]=table(path,key)
+  return t
+
+def fileName(PType,PRating):
+  'Returns the path of the table of PType and PRating in ./tables'
+  return join(tablesDir,PType+'_'+PRating+'.csv')
+
+def ratings(PType):
+  'Returns the list of PRatings available in ./tables for PType'
+  head=PType+'_'
+  return sorted([f[len(head):-4] for f in os.listdir(tablesDir) if f.startswith(head) and f.endswith('.csv')])
+
+def rows(PType,PRating,numeric=False):
+  '''
+  rows(PType, PRating, numeric=False)
+  Returns the list of rows of the table PType_PRating.csv:
+  an empty list if the table doesn't exist.
+  '''
+  path=fileName(PType,PRating)
+  if not os.path.isfile(path):
+    return []
+  t=getTable(path)
+  if numeric:
+    return list(t.values)
+  return list(t.rows)
+
+def find(PType,PRating,PSize,numeric=False):
+  '''
+  find(PType, PRating, PSize, numeric=False)
+  Returns the row of PSize in the table PType_PRating.csv, or None.
+  '''
+  path=fileName(PType,PRating)
+  if not os.path.isfile(path):
+    return None
+  return getTable(path).find(PSize,numeric)
+
+def clear():
+  'Forgets all the tables read so far'
+  tables.clear()
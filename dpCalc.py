@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#(c) 2018 R. T. LGPL3
+
+__title__="Pressure drop engine"
+__author__="oddtopus"
+__url__="github.com/oddtopus"
+__license__="LGPL 3"
+__doc__='''
+Calculation of the pressure drop along a string of pype-objects, apart
+from the dialog of fe_ChEDL.
+The data of all the elements are gathered once in NumPy arrays and the
+velocity, the Reynolds number, the Darcy friction factor, the loss
+coefficients and the pressure drop are calculated for all of them in
+one pass, with the same correlations of the library "fluids" of ChEDL:
+  Clamond's solution of Colebrook equation (or Churchill 1977),
+  Rennels' loss coefficient of rounded bends (fittings.bend_rounded),
+  dP=K*rho*v**2/2 and, for valves of liquids, dP=(Q/Kv)**2 bar.
+sweep() calculates in the same way the system curve of the line, that is
+its pressure drop for a whole array of flows (and of fluid properties).
+All quantities are in SI units (m, m3/s, kg/m3, Pa*s, Pa).
+'''
+
+import FreeCAD, labelIndex
+import numpy as np
+
+LAMINAR=2040. # Re of transition to turbulent flow in pipes, as in fluids
+TURBULENT=4000. # end of the transition, for the smooth friction factor
+
+def lineElements(o):
+  '''
+  lineElements(o)
+  Returns the list of the pype-objects of the PypeLine or PypeBranch o.
+  '''
+  if hasattr(o,'PType') and o.PType=='PypeBranch':
+    return [o.Document.getObject(name) for name in o.Tubes+o.Curves]
+  elif hasattr(o,'PType') and o.PType=='PypeLine':
+    return labelIndex.getObjectsByLabel(o.Label+'_pieces',o.Document)[0].OutList
+  return []
+
+def hasLoss(o):
+  'True if o is one element of the calculation: a Pipe, an Elbow or an object with a Kv'
+  return (hasattr(o,'PType') and o.PType in ['Pipe','Elbow']) or (hasattr(o,'Kv') and o.Kv>0)
+
+def gather(elements):
+  '''
+  gather(elements)
+  Returns the dictionary of arrays of the data of the Pipes, Elbows and
+  objects with a Kv of the list elements (other objects are skipped):
+    'Label','PType', 'ID' (m), 'L' (m), 'angle' (deg), 'R' (m), 'Kv'
+  '''
+  data=dict([(k,list()) for k in ['Label','PType','ID','L','angle','R','Kv']])
+  for o in elements:
+    if not hasLoss(o):
+      continue
+    if o.PType in ['Pipe','Elbow']:
+      row=[o.Label,o.PType,float(o.ID)/1000,0.,0.,0.,0.]
+      if o.PType=='Pipe':
+        row[3]=float(o.Height)/1000
+      else:
+        row[4:6]=[float(o.BendAngle),float(o.BendRadius)/1000]
+    else:
+      row=[o.Label,getattr(o,'PType','Kv'),hasattr(o,'ID') and float(o.ID)/1000 or 0.,0.,0.,0.,float(o.Kv)]
+    for k,v in zip(['Label','PType','ID','L','angle','R','Kv'],row):
+      data[k].append(v)
+  for k in ['ID','L','angle','R','Kv']:
+    data[k]=np.array(data[k],dtype=float)
+  return data
+
+def subset(data,indexes):
+  'Returns the data of gather() only for the elements of the array indexes'
+  sub=dict([(k,data[k][indexes]) for k in ['ID','L','angle','R','Kv']])
+  for k in ['Label','PType']:
+    sub[k]=[data[k][i] for i in indexes]
+  return sub
+
+def colebrook(Re,eD,method='Clamond'):
+  '''
+  colebrook(Re, eD, method='Clamond')
+  Returns the arrays (f, g) of the turbulent Darcy friction factors and of
+  their slopes g=dln(f)/dln(Re) for the arrays Re (>0) and eD: Clamond's
+  solution of Colebrook equation, or Churchill 1977 (method='Churchill').
+  '''
+  if method=='Churchill':
+    A3=(37530/Re)**16
+    w=(7./Re)**0.9+0.27*eD
+    A2=(2.457*np.log(w))**16
+    S=(8.0/Re)**12+1.0/(A2+A3)**1.5
+    dA=16*A2*(-0.9*(7./Re)**0.9/w)/np.log(w)-16*A3
+    return 8.0*S**(1.0/12.), (-12*(8.0/Re)**12-1.5*dA/(A2+A3)**2.5)/(12*S)
+  X1=eD*Re*0.1239681863354175460160858261654858382699
+  X2=np.log(Re)-0.7793974884556819406441139701653776731705
+  F=X2-0.2
+  X1F=X1+F
+  X1F1=1.+X1F
+  E=(np.log(X1F)-0.2)/X1F1
+  F=F-(X1F1+0.5*E)*E*X1F/(X1F1+E*(1.+E/3.))
+  X1F=X1+F
+  X1F1=1.+X1F
+  E=(np.log(X1F)+F-X2)/X1F1
+  b=X1F1+E*(1.+E/3.)
+  F=b/(b*F-(X1F1+0.5*E)*E*X1F)
+  f=1.325474527619599502640416597148504422899*F*F
+  # implicit derivative of 1/sqrt(f)=-2*log10(eD/3.7+2.51/(Re*sqrt(f)))
+  x=1/np.sqrt(f)
+  c=2/np.log(10)*2.51*x/(eD*Re/3.7+2.51*x)
+  return f, -2*c/(x+c)
+
+def darcy(Re,eD,method='Clamond',smooth=False,slope=False):
+  '''
+  darcy(Re, eD, method='Clamond', smooth=False, slope=False)
+  Returns the array of Darcy friction factors for the arrays Re and eD
+  (relative roughness): 64/Re in laminar flow, else the turbulent one of
+  colebrook(). Where Re is 0, the factor is 0.
+    smooth: if True, f is blended linearly between 64/Re and the
+      turbulent one for LAMINAR<=Re<TURBULENT, so that it's continuous
+    slope: if True, returns also the array of dln(f)/dln(Re)
+  '''
+  Re,eD=np.broadcast_arrays(np.asarray(Re,dtype=float),np.asarray(eD,dtype=float))
+  f=np.zeros(Re.shape)
+  g=np.full(Re.shape,-1.)
+  lam=(Re>0)&(Re<LAMINAR)
+  f[lam]=64/Re[lam]
+  t=Re>=LAMINAR
+  f[t],g[t]=colebrook(Re[t],eD[t],method)
+  if smooth:
+    b=t&(Re<TURBULENT)
+    Rb,fb,gb=Re[b],f[b],g[b]
+    w=(Rb-LAMINAR)/(TURBULENT-LAMINAR)
+    f[b]=(1-w)*64/Rb+w*fb
+    g[b]=(Rb/(TURBULENT-LAMINAR)*(fb-64/Rb)-(1-w)*64/Rb+w*fb*gb)/f[b]
+  if slope:
+    return f, g
+  return f
+
+def bendK(ID,angle,fd,R):
+  'Returns the array of loss coefficients of rounded bends (Rennels), as fluids.fittings.bend_rounded()'
+  a=np.radians(angle)
+  s=np.sin(0.5*a)
+  rD=np.where(ID>0,R/np.where(ID>0,ID,1),1)
+  return fd*a*rD+(0.10+2.4*fd)*s+6.6*fd*(np.sqrt(s)+s)/rD**(4.*a/np.pi)
+
+RESULT=[('Label','U64'),('PType','U16'),('ID','f8'),('L','f8'),('v','f8'),('Re','f8'),('f','f8'),('K','f8'),('Dp','f8')]
+
+def losses(data,Q,rho,mu,roughness,liquid=True,method='Clamond',smooth=False,derivative=False):
+  '''
+  losses(data, Q, rho, mu, roughness, liquid=True, method='Clamond',
+    smooth=False, derivative=False)
+  Returns the dictionary of arrays 'v', 'Re', 'f', 'K', 'Dp' of the
+  elements in data (see gather()) for the flow Q, that is one float or
+  one array with the flow of each element: negative flows give negative
+  velocities and pressure drops.
+    smooth: the friction factor is continuous in the transition (see darcy())
+    derivative: if True, the dictionary has also 'dDp', the derivative
+      of the pressure drop with respect to the flow (Pa*s/m3)
+  '''
+  ID=data['ID']
+  Q=np.asarray(Q,dtype=float)
+  sign=np.sign(Q)
+  Q=np.abs(Q)
+  A=ID**2*np.pi/4
+  v=np.where(A>0,Q/np.where(A>0,A,1),0.)
+  Re=rho*v*ID/mu
+  pipes=np.array([t=='Pipe' for t in data['PType']],dtype=bool)
+  bends=np.array([t=='Elbow' for t in data['PType']],dtype=bool)
+  fd,g=darcy(Re,roughness/np.where(ID>0,ID,1),method,smooth,True)
+  fd=np.where(pipes|bends,fd,0.)
+  K=np.where(pipes,fd*data['L']/np.where(ID>0,ID,1),0.)
+  K=np.where(bends,bendK(ID,data['angle'],fd,data['R']),K)
+  Dp=K*rho*v**2/2
+  valves=~(pipes|bends)
+  Kv=np.where(data['Kv']>0,data['Kv'],1)
+  if liquid:
+    Dp=np.where(valves,(Q*3600/Kv)**2*1e5,Dp)
+  else:
+    Dp=np.where(valves,0.,Dp) # TODO formulas for gases and steam
+  res={'v':v*sign,'Re':Re,'f':fd,'K':K,'Dp':Dp*sign}
+  if derivative:
+    # K=c0+c1*f: dDp/dQ=rho/(2*A)*(2*c0*v+c1*f*v*(2+dln(f)/dln(Re))),
+    # with f*v=64*mu/(rho*ID) in the limit of Q=0
+    c0=np.where(bends,bendK(ID,data['angle'],0.,data['R']),0.)
+    c1=np.where(bends,bendK(ID,data['angle'],1.,data['R'])-c0,np.where(pipes,data['L']/np.where(ID>0,ID,1),0.))
+    fv=np.where(Re>0,fd*v,np.where(ID>0,64*mu/(rho*np.where(ID>0,ID,1)),0.))
+    dDp=np.where(A>0,rho/(2*np.where(A>0,A,1))*(2*c0*v+c1*fv*(2+g)),0.)
+    if liquid:
+      dDp=np.where(valves,2*Q*(3600/Kv)**2*1e5,dDp)
+    else:
+      dDp=np.where(valves,0.,dDp)
+    res['dDp']=dDp
+  return res
+
+def pressureDrop(elements,Q,rho,mu,roughness,liquid=True,method='Clamond'):
+  '''
+  pressureDrop(elements, Q, rho, mu, roughness, liquid=True, method='Clamond')
+  Returns the structured array of the results for each element:
+    'Label', 'PType', 'ID' (m), 'L' (m), 'v' (m/s), 'Re', 'f' (Darcy),
+    'K', 'Dp' (Pa)
+    elements: list of pype-objects or the dictionary returned by gather()
+    Q: volumetric flow (m3/s)
+    rho, mu: density (kg/m3) and dynamic viscosity (Pa*s)
+    roughness: absolute roughness of the pipes (m)
+    liquid: if False, the drop through Kv is not calculated
+  '''
+  data=elements if type(elements)==dict else gather(elements)
+  res=losses(data,Q,rho,mu,roughness,liquid,method)
+  result=np.zeros(len(data['ID']),dtype=RESULT)
+  result['Label']=data['Label']
+  result['PType']=data['PType']
+  result['ID']=data['ID']
+  result['L']=data['L']
+  for k in ['v','Re','f','K','Dp']:
+    result[k]=res[k]
+  return result
+
+def summary(result):
+  'Returns (total pressure drop (Pa), total length of pipes (m), nr. of curves) of the result of pressureDrop()'
+  return float(result['Dp'].sum()), float(result['L'].sum()), int((result['PType']=='Elbow').sum())
+
+SWEEP=[('T','f8'),('Q','f8'),('rho','f8'),('mu','f8'),('vmax','f8'),('Dp','f8')]
+
+def sweep(elements,Q,rho,mu,roughness,liquid=True,method='Clamond',T=None):
+  '''
+  sweep(elements, Q, rho, mu, roughness, liquid=True, method='Clamond', T=None)
+  Returns the structured array of the operating points of the line (its
+  system curve) for the array of flows Q:
+    'T' (K), 'Q' (m3/s), 'rho', 'mu', 'vmax' (m/s), 'Dp' (Pa, total)
+    rho, mu, T: floats or arrays with one value for each point, e.g. the
+      properties of the fluid at different temperatures; T is only
+      reported (default nan)
+  The losses of all the points and all the elements are calculated in one
+  pass over arrays of shape (points, elements).
+  '''
+  data=elements if type(elements)==dict else gather(elements)
+  Q=np.atleast_1d(np.asarray(Q,dtype=float))
+  rho,mu=[np.broadcast_to(np.asarray(x,dtype=float),Q.shape) for x in [rho,mu]]
+  curve=np.zeros(len(Q),dtype=SWEEP)
+  curve['T']=np.nan if T is None else T
+  curve['Q'],curve['rho'],curve['mu']=Q,rho,mu
+  if len(data['ID']):
+    res=losses(data,Q[:,None],rho[:,None],mu[:,None],roughness,liquid,method)
+    curve['vmax']=np.abs(res['v']).max(axis=1)
+    curve['Dp']=res['Dp'].sum(axis=1)
+  return curve
+
+def writeCSV(fileName,curve):
+  'Writes the structured array curve, returned by sweep() or pressureDrop(), in the file fileName (";" separated)'
+  import csv
+  f=open(fileName,'w')
+  w=csv.writer(f,delimiter=';',lineterminator='\n')
+  w.writerow(curve.dtype.names)
+  for row in curve:
+    w.writerow([isinstance(x,float) and '%g' %x or x for x in row.tolist()])
+  f.close()
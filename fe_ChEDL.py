@@ -32,7 +32,8 @@ https://github.com/CalebBell/fluids.
 Caleb Bell (2016). thermo: Chemical properties component of Chemical Engineering Design Library (ChEDL)
 https://github.com/CalebBell/thermo.
 '''  
-import FreeCAD,FreeCADGui, csv
+import FreeCAD,FreeCADGui, csv, labelIndex, dpCalc, fluidProps, pipeSizing, catalog
+import numpy as np
 pq=FreeCAD.Units.parseQuantity
 from PySide import QtCore, QtGui
 from os.path import join, dirname, abspath
@@ -75,65 +76,29 @@ class dpCalcDialog:
     self.form.radioLiquid.released.connect(self.setLiquid)
     self.form.radioGas.released.connect(self.setGas)
     self.form.butExport.clicked.connect(self.export)
+    self.form.butSweep.clicked.connect(self.sweep)
+    self.form.butSize.clicked.connect(self.size)
     self.form.comboWhat.currentIndexChanged.connect(lambda: self.form.labResult.setText('---'))
     self.isLiquid=True
+    self.curve=None
     self.checkFluid()
+  def getElements(self):
+    if self.form.comboWhat.currentText()=='<on selection>':
+      return FreeCADGui.Selection.getSelection()
+    o=labelIndex.getObjectsByLabel(self.form.comboWhat.currentText())[0]
+    return dpCalc.lineElements(o)
   def accept(self):
-    Dp=Ltot=nc=0
-    elements=list()
     Q=float(self.form.editFlow.text())/3600
     if not self.isLiquid:
       Q=Q/self.Rho
-    if self.form.comboWhat.currentText()=='<on selection>':
-      elements = FreeCADGui.Selection.getSelection()
-    else:
-      o=FreeCAD.ActiveDocument.getObjectsByLabel(self.form.comboWhat.currentText())[0]
-      if hasattr(o,'PType') and o.PType=='PypeBranch':
-        elements=[FreeCAD.ActiveDocument.getObject(name) for name in o.Tubes+o.Curves]
-      elif hasattr(o,'PType') and o.PType=='PypeLine':
-        group=FreeCAD.ActiveDocument.getObjectsByLabel(o.Label+'_pieces')[0]
-        elements=group.OutList
-    self.form.editResults.clear()
-    for o in elements:
-      loss=0
-      if hasattr(o,'PType') and o.PType in ['Pipe','Elbow']:
-        ID=float(o.ID)/1000
-        e=float(self.form.editRough.text())*1e-6/ID
-        v=Q/((ID)**2*pi/4)
-        Re=Reynolds(V=v,D=ID,rho=self.Rho, mu=self.Mu)
-        f=friction.friction_factor(Re, eD=e) # Darcy, =4xFanning
-        if o.PType=='Pipe':
-          L=float(o.Height)/1000
-          Ltot+=L
-          K=K_from_f(fd=f, L=L, D=ID)
-          loss=dP_from_K(K,rho=self.Rho,V=v)
-          FreeCAD.Console.PrintMessage('%s: %s\nID=%.2f\nV=%.2f\ne=%f\nf=%f\nK=%f\nL=%.3f\nDp = %.5f bar\n***'%(o.PType,o.Label,ID,v,e,f,K,L,loss/1e5))
-          self.form.editResults.append('%s\t%.1f mm\t%.1f m/s\t%.5f bar'%(o.Label,ID*1000,v,loss/1e5))
-        elif o.PType=='Elbow':
-          ang=float(o.BendAngle)
-          R=float(o.BendRadius)/1000
-          nc+=1
-          K=fittings.bend_rounded(ID,ang,f,R)
-          loss=dP_from_K(K,rho=self.Rho,V=v)
-          FreeCAD.Console.PrintMessage('%s: %s\nID=%.2f\nV=%.2f\ne=%f\nf=%f\nK=%f\nang=%.3f\nR=%f\nDp = %.5f bar\n***'%(o.PType,o.Label,ID,v,e,f,K,ang,R,loss/1e5))
-          self.form.editResults.append('%s\t%.1f mm\t%.1f m/s\t%.5f bar'%(o.Label,ID*1000,v,loss/1e5))
-        elif o.PType=='Reduct':
-          pass
-      elif hasattr(o,'Kv') and o.Kv>0:
-        if self.isLiquid:
-          loss=(Q*3600/o.Kv)**2*100000
-        elif self.form.comboFluid.currentText()=='water' and not self.isLiquid:
-          pass # TODO formula for steam
-        else:
-          pass # TODO formula for gases
-        if hasattr(o,'ID'):
-          ID = float(o.ID)/1000
-          v=Q/(ID**2*pi/4)
-        else: 
-          v = 0
-          ID = 0
-        self.form.editResults.append('%s\t%.1f mm\t%.1f m/s\t%.5f bar'%(o.Label,ID*1000,v,loss/1e5))
-      Dp+=loss
+    elements=self.getElements()
+    e=float(self.form.editRough.text())*1e-6
+    res=dpCalc.pressureDrop(elements,Q,self.Rho,self.Mu,e,self.isLiquid)
+    self.curve=None
+    Dp,Ltot,nc=dpCalc.summary(res)
+    lines=['%s\t%.1f mm\t%.1f m/s\t%.5f bar'%(r['Label'],r['ID']*1000,r['v'],r['Dp']/1e5) for r in res]
+    self.form.editResults.setPlainText('\n'.join(lines))
+    FreeCAD.Console.PrintMessage('Dp of %i elements:\n%s\n***\n'%(len(res),'\n'.join(['%s: %s\tRe=%.0f\tf=%f\tK=%f'%(r['PType'],r['Label'],r['Re'],r['f'],r['K']) for r in res])))
     if Dp>200: result=' = %.3f bar'%(Dp/100000)
     else: result=' = %.2e bar'%(Dp/100000)
     self.form.labResult.setText(result)
@@ -146,11 +111,8 @@ class dpCalcDialog:
     if self.form.comboFluid.currentText()!='<custom fluid>':
       self.form.editDensity.setEnabled(False)
       self.form.editViscosity.setEnabled(False)
-      try: 
-        self.fluid=Chemical(self.form.comboFluid.currentText(),T=T,P=P)
-        self.isMixture=False
-      except: 
-        self.fluid=Mixture(self.form.comboFluid.currentText(),T=T,P=P)
+      self.fluid=fluidProps.state(self.form.comboFluid.currentText(),T,P)
+      self.isMixture=self.fluid.isMixture
       if self.fluid.rhol and self.fluid.mul:
         self.setLiquid()
         self.form.radioLiquid.setChecked(True)
@@ -161,9 +123,7 @@ class dpCalcDialog:
         self.form.labState.setText('*** SOLID (no flow) ***')
         self.form.editFlow.setText('0')
       if not self.isMixture:
-        CAS=identifiers.CAS_from_any(self.form.comboFluid.currentText())
-        IUPAC=identifiers.IUPAC_name(CAS)
-        formula=identifiers.formula(CAS)
+        CAS,IUPAC,formula=fluidProps.identity(self.form.comboFluid.currentText()) or ('-','-','-')
         self.form.labName.setText('CAS = %s\nIUPAC = %s\nformula = %s'%(CAS,IUPAC,formula))
       else:
         self.form.labName.setText(self.form.comboFluid.currentText()+'\n(mixture)')
@@ -209,7 +169,95 @@ class dpCalcDialog:
   def setMu(self):
     self.Mu=float(self.form.editViscosity.text())*self.Rho/1000000 # conversion between kinematic and dynamic!!
     print("%f Pa*s" %self.Mu)
+  def sweep(self):
+    'Calculates the system curve of the line for a range of flows and, optionally, of temperatures'
+    text,ok=QInputDialog.getText(None,'Sweep','%s: min, max, nr. of points\n[; T (C): min, max, nr. of points]' %self.form.labQ.text(),text='0, %s, 50' %self.form.editFlow.text())
+    if not ok:
+      return
+    try:
+      ranges=[[float(x) for x in r.split(',')] for r in text.split(';')]
+      Qs=np.linspace(ranges[0][0],ranges[0][1],int(ranges[0][2]))
+      if len(ranges)>1:
+        Ts=np.linspace(ranges[1][0],ranges[1][1],int(ranges[1][2]))
+      else:
+        Ts=np.array([float(self.form.editTemperature.text())])
+    except:
+      QMessageBox.warning(None,'Invalid input','Write: min, max, nr. of points\ne.g. 0, 50, 50 or 0, 50, 50; 20, 80, 4')
+      return
+    if len(Ts)>1 and not self.fluid:
+      QMessageBox.warning(None,'Custom fluid','The properties of custom fluids\nare known only at one temperature.')
+      return
+    T,Q=[a.ravel() for a in np.meshgrid(Ts+273.16,Qs/3600,indexing='ij')]
+    if len(Ts)>1:
+      P=float(self.form.editPressure.text())*1e5
+      rho,mu=fluidProps.properties(self.form.comboFluid.currentText(),T,P,self.isLiquid and 'l' or 'g')
+    else:
+      rho,mu=self.Rho,self.Mu
+    if not self.isLiquid:
+      Q=Q/rho
+    e=float(self.form.editRough.text())*1e-6
+    self.curve=dpCalc.sweep(self.getElements(),Q,rho,mu,e,self.isLiquid,T=T)
+    lines=['T (C)\t%s\tvmax (m/s)\tDp (bar)' %self.form.labQ.text()]
+    lines+=['%.1f\t%.3f\t%.2f\t%.5f' %(t-273.16,q,r['vmax'],r['Dp']/1e5) for t,q,r in zip(T,np.tile(Qs,len(Ts)),self.curve)]
+    self.form.editResults.setPlainText('\n'.join(lines))
+    self.form.labResult.setText('%i points: see results' %len(self.curve))
+    try:
+      import matplotlib.pyplot as plt
+    except:
+      FreeCAD.Console.PrintWarning('Install matplotlib to plot the system curve\n')
+      return
+    plt.figure()
+    for t,Dp in zip(Ts,self.curve['Dp'].reshape(len(Ts),len(Qs))):
+      plt.plot(Qs,Dp/1e5,label='%g C' %t)
+    plt.xlabel(self.form.labQ.text())
+    plt.ylabel('Dp (bar)')
+    plt.title(self.form.comboWhat.currentText())
+    plt.grid(True)
+    if len(Ts)>1: plt.legend()
+    plt.show()
+  def size(self):
+    'Ranks the sizes of the catalog for the line, or the selected lines, and applies the best one'
+    lines=[o for o in FreeCADGui.Selection.getSelection() if getattr(o,'PType','') in ['PypeLine','PypeBranch']]
+    if not lines and self.form.comboWhat.currentText()!='<on selection>':
+      lines=labelIndex.getObjectsByLabel(self.form.comboWhat.currentText())[:1]
+    if not lines:
+      QMessageBox.warning(None,'Size','Select one or more PypeLines or PypeBranches.')
+      return
+    text,ok=QInputDialog.getText(None,'Size','v max (m/s), Dp max (bar/100 m), PRatings',text='3, 0.5, '+', '.join(catalog.ratings('Pipe')))
+    if not ok:
+      return
+    try:
+      values=[x.strip() for x in text.split(',')]
+      vmax,dpmax=float(values[0]),float(values[1])*1e5
+      ratings=[r for r in values[2:] if r]
+    except:
+      QMessageBox.warning(None,'Invalid input','Write: v max, Dp max, PRatings\ne.g. 3, 0.5, SCH-STD')
+      return
+    Q=float(self.form.editFlow.text())/3600
+    if not self.isLiquid:
+      Q=Q/self.Rho
+    e=float(self.form.editRough.text())*1e-6
+    rankings=pipeSizing.optimize(lines,Q,self.Rho,self.Mu,e,vmax,dpmax,ratings)
+    text=list()
+    for l,r in zip(lines,rankings):
+      text.append('%s: %s' %(l.Label,len(r) and r[0]['ok'] and '%s %s' %(r[0]['PRating'],r[0]['PSize']) or 'no size fits'))
+      text+=['  %s %s\t%.1f mm\t%.2f m/s\t%.4f bar/100 m%s' %(s['PRating'],s['PSize'],s['ID'],s['v'],s['dp100']/1e5,not s['ok'] and ' (out of limits)' or '') for s in r[:5]]
+    self.curve=None
+    self.form.editResults.setPlainText('\n'.join(text))
+    fit=[(l,r[0]) for l,r in zip(lines,rankings) if len(r) and r[0]['ok']]
+    self.form.labResult.setText('%i of %i lines sized: see results' %(len(fit),len(lines)))
+    if fit and QMessageBox.question(None,'Size','Apply the best size to %i lines?' %len(fit),QMessageBox.Yes|QMessageBox.No)==QMessageBox.Yes:
+      FreeCAD.ActiveDocument.openTransaction('Size lines')
+      for l,s in fit:
+        pipeSizing.applySize(l,s,False)
+      FreeCAD.ActiveDocument.commitTransaction()
+      FreeCAD.ActiveDocument.recompute()
   def export(self):
+    if self.curve is not None:
+      f=QtGui.QFileDialog.getSaveFileName()[0]
+      if f:
+        dpCalc.writeCSV(abspath(f),self.curve)
+      return
     rows=list()
     fields=['Item','ID (mm)','v (m/s)','Dp (bar)']
     for row in self.form.editResults.toPlainText().split('\n'):
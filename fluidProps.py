@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#(c) 2018 R. T. LGPL3
+
+__title__="Fluid properties"
+__author__="oddtopus"
+__url__="github.com/oddtopus"
+__license__="LGPL 3"
+__doc__='''
+Provider of the properties of fluids for the pressure drop calculations,
+on top of the library "thermo" of ChEDL, whose Chemical and Mixture are
+slow to build.
+state(name, T, P) looks up in order:
+  - a LRU cache in memory, keyed on (name, T, P, phase)
+  - the grid of tables/Fluid_<name>.csv, if any (water and air): the
+    logarithms of properties are interpolated linearly in T and log(P)
+  - the cache on disk (<user data dir>/flamingo/fluids.json), if enabled
+    in preferences (FluidDiskCache)
+and only at last builds the Chemical, or the Mixture, with thermo.
+The identifiers (CAS, IUPAC name, formula) are read once for each fluid.
+T in K, P in Pa, density in kg/m3, dynamic viscosity in Pa*s.
+'''
+
+import FreeCAD, os, json
+from collections import OrderedDict
+
+FIELDS=['rhol','mul','rhog','mug']
+
+def getParams():
+  return FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/flamingo")
+
+class fluidState(object):
+  '''
+  The properties of fluid name at T, P: attributes .rhol, .mul, .rhog,
+  .mug (None if not available), .isMixture and .source, that is
+  'thermo', 'grid' or 'disk'.
+  '''
+  def __init__(self,name,T,P,values,isMixture=False,source='thermo'):
+    self.name,self.T,self.P=name,T,P
+    for k in FIELDS:
+      setattr(self,k,values.get(k))
+    self.isMixture=isMixture
+    self.source=source
+  def values(self):
+    return dict([(k,getattr(self,k)) for k in FIELDS])
+
+def compute(name,T,P):
+  '''
+  compute(name, T, P)
+  Returns the fluidState calculated by thermo: the Chemical name or, if
+  it's not a pure substance, the Mixture.
+  '''
+  from thermo import Chemical, Mixture
+  isMixture=False
+  try:
+    f=Chemical(name,T=T,P=P)
+  except:
+    f=Mixture(name,T=T,P=P)
+    isMixture=True
+  values=dict()
+  for k in FIELDS:
+    try:
+      values[k]=float(getattr(f,k)) if getattr(f,k) else None
+    except:
+      values[k]=None
+  return fluidState(name,T,P,values,isMixture)
+
+################ GRIDS ###########################
+
+grids=dict()
+
+def gridFile(name):
+  import catalog
+  return catalog.fileName('Fluid',name)
+
+def getGrid(name):
+  '''
+  getGrid(name)
+  Returns (Ts, logPs, {field: array(nT,nP)}, isMixture) of the table
+  Fluid_<name>.csv, or None if it doesn't exist.
+  '''
+  import catalog
+  import numpy as np
+  path=gridFile(name)
+  if not os.path.isfile(path):
+    return None
+  t=catalog.getTable(path)
+  g=grids.get(name)
+  if g and g[0] is t:
+    return g[1]
+  Ts=sorted(set([row['T'] for row in t.values]))
+  Ps=sorted(set([row['P'] for row in t.values]))
+  arrays=dict([(k,np.full((len(Ts),len(Ps)),np.nan)) for k in FIELDS])
+  for row in t.values:
+    i,j=Ts.index(row['T']),Ps.index(row['P'])
+    for k in FIELDS:
+      if type(row[k])==float: arrays[k][i,j]=row[k]
+  isMixture=bool(t.values and t.values[0].get('mixture')==1)
+  grid=(np.array(Ts)+273.15,np.log(np.array(Ps)*1e5),arrays,isMixture)
+  grids[name]=(t,grid)
+  return grid
+
+def interpolate(name,T,P,phase=None):
+  '''
+  interpolate(name, T, P, phase=None)
+  Returns the fluidState interpolated in the grid of name, or None if
+  there's no grid, T or P are out of it or the values of the phase
+  ('l', 'g' or None for both) are not known at all corners of the cell.
+  '''
+  import numpy as np
+  grid=getGrid(name)
+  if not grid or P<=0:
+    return None
+  Ts,logPs,arrays,isMixture=grid
+  x,y=T,np.log(P)
+  if not (Ts[0]<=x<=Ts[-1] and logPs[0]<=y<=logPs[-1]) or len(Ts)<2 or len(logPs)<2:
+    return None
+  i=min(np.searchsorted(Ts,x,'right')-1,len(Ts)-2)
+  j=min(np.searchsorted(logPs,y,'right')-1,len(logPs)-2)
+  u=(x-Ts[i])/(Ts[i+1]-Ts[i])
+  w=(y-logPs[j])/(logPs[j+1]-logPs[j])
+  values=dict()
+  for k in FIELDS:
+    c=arrays[k][i:i+2,j:j+2]
+    if np.isnan(c).all() or (phase and not k.endswith(phase)):
+      values[k]=None
+    elif np.isnan(c).any():
+      return None # the phase changes in the cell
+    else:
+      c=np.log(c) # densities go with P and viscosities with exp(1/T)
+      values[k]=float(np.exp(c[0,0]*(1-u)*(1-w)+c[1,0]*u*(1-w)+c[0,1]*(1-u)*w+c[1,1]*u*w))
+  return fluidState(name,T,P,values,isMixture,'grid')
+
+def makeGrid(name,Ts,Ps,fileName=None):
+  '''
+  makeGrid(name, Ts, Ps, fileName=None)
+  Writes the table of the properties of name calculated by thermo at
+  the temperatures Ts (deg C) and pressures Ps (bar), in fileName
+  (default tables/Fluid_<name>.csv).
+  '''
+  import csv
+  fileName=fileName or gridFile(name)
+  f=open(fileName,'w')
+  w=csv.writer(f,delimiter=';',lineterminator='\n')
+  w.writerow(['T','P']+FIELDS+['mixture'])
+  for T in Ts:
+    for P in Ps:
+      s=compute(name,T+273.15,P*1e5)
+      w.writerow(['%g' %T,'%g' %P]+[s.values()[k] is not None and '%.6g' %s.values()[k] or '' for k in FIELDS]+[int(s.isMixture)])
+  f.close()
+
+################ CACHES ###########################
+
+class diskCache(object):
+  '''
+  diskCache(path=None)
+  The states of fluids calculated by thermo, saved in one .json file.
+    path (string): default = <user data dir>/flamingo/fluids.json
+  '''
+  def __init__(self,path=None):
+    if not path:
+      path=os.path.join(FreeCAD.getUserAppDataDir(),'flamingo','fluids.json')
+    self.path=path
+    self.states=None
+  def enabled(self):
+    return getParams().GetBool('FluidDiskCache',False)
+  def read(self):
+    if self.states is None:
+      self.states=dict()
+      if os.path.exists(self.path):
+        try:
+          f=open(self.path,'r')
+          self.states=json.load(f)
+          f.close()
+        except:
+          FreeCAD.Console.PrintWarning('Fluids cache: %s not readable\n' %self.path)
+    return self.states
+  def load(self,key):
+    if not self.enabled():
+      return None
+    data=self.read().get(repr(key))
+    if data:
+      name,T,P,phase=key
+      return fluidState(name,T,P,data['values'],data['isMixture'],'disk')
+  def save(self,key,state):
+    if not self.enabled():
+      return
+    self.read()[repr(key)]={'values':state.values(),'isMixture':state.isMixture}
+    try:
+      if not os.path.isdir(os.path.dirname(self.path)):
+        os.makedirs(os.path.dirname(self.path))
+      tmp=self.path+'.%i.tmp' %os.getpid()
+      f=open(tmp,'w')
+      json.dump(self.states,f)
+      f.close()
+      if os.path.exists(self.path): os.remove(self.path)
+      os.rename(tmp,self.path)
+    except:
+      FreeCAD.Console.PrintWarning('Fluids cache: unable to write %s\n' %self.path)
+  def clear(self):
+    self.states=dict()
+    if os.path.exists(self.path):
+      os.remove(self.path)
+
+disk=diskCache()
+states=OrderedDict() # LRU cache in memory
+identities=dict()
+
+def key(name,T,P,phase=None):
+  'Returns the key of the caches: T and P are rounded to 0.01 K and 1 Pa'
+  return (name,round(float(T),2),round(float(P)),phase)
+
+def state(name,T,P,phase=None):
+  '''
+  state(name, T, P, phase=None)
+  Returns the fluidState of name at T (K) and P (Pa).
+    phase: 'l' or 'g' if only the properties of liquid or gas are needed
+  '''
+  k=key(name,T,P,phase)
+  s=states.pop(k,None)
+  if not s:
+    s=interpolate(name,T,P,phase) or disk.load(k)
+    if not s:
+      s=compute(name,T,P)
+      disk.save(k,s)
+  states[k]=s # most recently used at the end
+  while len(states)>getParams().GetInt('FluidCacheSize',256):
+    states.popitem(last=False)
+  return s
+
+def properties(name,Ts,P,phase='l'):
+  '''
+  properties(name, Ts, P, phase='l')
+  Returns the arrays (rho, mu) of the phase ('l' or 'g') of name at the
+  temperatures Ts (K) and pressure P (Pa), nan where not available.
+  Each distinct temperature is looked up once with state().
+  '''
+  import numpy as np
+  Ts=np.atleast_1d(np.asarray(Ts,dtype=float))
+  values=dict()
+  for T in set(Ts.tolist()):
+    s=state(name,T,P,phase)
+    values[T]=[getattr(s,k+phase) or np.nan for k in ['rho','mu']]
+  rho,mu=np.array([values[T] for T in Ts.tolist()]).reshape(-1,2).T
+  return rho, mu
+
+def identity(name):
+  '''
+  identity(name)
+  Returns (CAS, IUPAC name, formula) of the pure substance name, or None
+  for mixtures.
+  '''
+  if name not in identities:
+    try:
+      from thermo import identifiers
+      CAS=identifiers.CAS_from_any(name)
+      identities[name]=(CAS,identifiers.IUPAC_name(CAS),identifiers.formula(CAS))
+    except:
+      identities[name]=None
+  return identities[name]
+
+def clear(onDisk=False):
+  'Empties the caches in memory and, if onDisk, also the one on disk'
+  states.clear()
+  grids.clear()
+  if onDisk: disk.clear()
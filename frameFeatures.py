@@ -5,7 +5,7 @@ __author__="oddtopus"
 __url__="github.com/oddtopus/flamingo"
 __license__="LGPL 3"
 
-import FreeCAD, FreeCADGui, Part, csv
+import FreeCAD, FreeCADGui, Part, csv, catalog, labelIndex
 import ArchProfile
 from Arch import makeStructure
 from PySide.QtCore import *
@@ -103,7 +103,7 @@ class frameLineForm(QDialog):
   def setCurrentFL(self,FLName=None):
     if self.combo.currentText() not in ['<none>','<new>']:
       FreeCAD.__activeFrameLine__= self.combo.currentText()
-      self.current=FreeCAD.ActiveDocument.getObjectsByLabel(self.combo.currentText())[0]
+      self.current=labelIndex.getObjectsByLabel(self.combo.currentText())[0]
       FreeCAD.Console.PrintMessage('current FrameLine = '+self.current.Label+'\n')
       if self.current.Profile:
         FreeCAD.Console.PrintMessage('Profile: %s\n'%self.current.Profile.Label)
@@ -128,7 +128,7 @@ class frameLineForm(QDialog):
       FreeCAD.Console.PrintError('No set of profiles in this document.\nCreate the sections first.\n')
   def setCurrent(self,flname):
     if flname!='<new>':
-      self.current=FreeCAD.ActiveDocument.getObjectsByLabel(flname)[0]
+      self.current=labelIndex.getObjectsByLabel(flname)[0]
       FreeCAD.Console.PrintMessage('current FrameLine = '+self.current.Label+'\n')
     else:
       self.current=None
@@ -147,7 +147,7 @@ class frameLineForm(QDialog):
       if self.sectList.selectedItems():
         self.getProfile()
     elif self.sectList.selectedItems():
-      prof= FreeCAD.ActiveDocument.getObjectsByLabel(self.sectList.selectedItems()[0].text())[0]
+      prof= labelIndex.getObjectsByLabel(self.sectList.selectedItems()[0].text())[0]
       for e in edges():
         if self.cb1.isChecked():
           s=makeStructure(FreeCAD.ActiveDocument.copyObject(prof))
@@ -188,7 +188,7 @@ class frameLineForm(QDialog):
       if beams():
         self.current.Profile=beams()[0].Base
       elif self.sectList.selectedItems():
-        prof= FreeCAD.ActiveDocument.getObjectsByLabel(self.sectList.selectedItems()[0].text())[0]
+        prof= labelIndex.getObjectsByLabel(self.sectList.selectedItems()[0].text())[0]
         if prof.Shape.ShapeType=='Wire' and self.cb2.isChecked():
           prof.Placement.move(FreeCAD.Vector(0,0,0)-prof.Shape.CenterOfMass)
         prof.Placement.Rotation=FreeCAD.Base.Rotation()
@@ -228,9 +228,8 @@ class insertSectForm(QWidget):
     self.sizeList.setMaximumWidth(120)
     self.firstCol.layout().addWidget(self.sizeList)
     self.sectDictList=[]
-    self.fileList=listdir(join(dirname(abspath(__file__)),"tables"))
     self.fillSizes()
-    self.PRatingsList=[s.lstrip("Section_").rstrip(".csv") for s in self.fileList if s.startswith("Section")]
+    self.PRatingsList=catalog.ratings('Section')
     self.secondCol=QWidget()
     self.secondCol.setLayout(QVBoxLayout())
     self.lab1=QLabel('Section types:')
@@ -249,15 +248,10 @@ class insertSectForm(QWidget):
     self.show()
   def fillSizes(self):
     self.sizeList.clear()
-    for fileName in self.fileList:
-      if fileName=='Section_'+self.SType+'.csv':
-        f=open(join(dirname(abspath(__file__)),"tables",fileName),'r')
-        reader=csv.DictReader(f,delimiter=';')
-        self.sectDictList=[x for x in reader]
-        f.close()
-        for row in self.sectDictList:
-          s=row['SSize']
-          self.sizeList.addItem(s)
+    self.sectDictList=catalog.rows('Section',self.SType)
+    for row in self.sectDictList:
+      s=row['SSize']
+      self.sizeList.addItem(s)
   def changeRating(self,item):
     self.SType=item.text()
     self.currentRatingLab.setText('Section: '+self.SType)
@@ -312,7 +306,7 @@ class FrameLine(object):
       #fp.Profile.Placement.Base=FreeCAD.Vector(0,0,0) 
       FreeCAD.Console.PrintWarning(fp.Label+' Profile has changed to '+fp.Profile.Label+'\n')
   def purge(self,fp):
-    group=FreeCAD.activeDocument().getObjectsByLabel(fp.Group)[0]
+    group=labelIndex.getObjectsByLabel(fp.Group)[0]
     from frameCmd import beams
     beams2purge=beams(group.OutList)
     if beams2purge:
@@ -328,7 +322,7 @@ class FrameLine(object):
       if not edges:
         FreeCAD.Console.PrintError('Base has not valid edges\n')
         return
-    group=FreeCAD.activeDocument().getObjectsByLabel(fp.Group)[0]
+    group=labelIndex.getObjectsByLabel(fp.Group)[0]
     if fp.Profile:
       FreeCAD.activeDocument().openTransaction('Update frameLine')
       from Arch import makeStructure
@@ -0,0 +1,93 @@
+#(c) 2018 R. T. LGPL: part of Flamingo tools w.b. for FreeCAD
+
+__title__="pypeTools label index"
+__author__="oddtopus"
+__url__="github.com/oddtopus/flamingo"
+__license__="LGPL 3"
+__doc__='''
+Index of the objects of the open documents by Label, kept current by a
+document observer: getObjectsByLabel() replaces the linear scan of
+Document.getObjectsByLabel() used to find PypeLines, FrameLines and
+their groups.
+If the observer is not available, or the index is found out of date,
+it falls back to the scan of the document and rebuilds the index.
+'''
+
+import FreeCAD
+
+class labelIndex(object):
+  '''
+  labelIndex()
+  Dictionary {<document Name>: {<Label>: [<object Name>, ...]}} updated
+  by the slots of FreeCAD's document observers.
+  '''
+  def __init__(self):
+    self.docs=dict()   # doc.Name -> {Label: [Name,...]}
+    self.labels=dict() # doc.Name -> {Name: Label}
+  def build(self,doc):
+    'Indexes all the objects of doc'
+    byLabel=self.docs[doc.Name]=dict()
+    byName=self.labels[doc.Name]=dict()
+    for o in doc.Objects:
+      byLabel.setdefault(o.Label,[]).append(o.Name)
+      byName[o.Name]=o.Label
+  def add(self,obj):
+    doc=obj.Document.Name
+    if doc in self.docs:
+      self.docs[doc].setdefault(obj.Label,[]).append(obj.Name)
+      self.labels[doc][obj.Name]=obj.Label
+  def remove(self,doc,name):
+    if doc in self.docs and name in self.labels[doc]:
+      label=self.labels[doc].pop(name)
+      names=self.docs[doc].get(label,[])
+      if name in names:
+        names.remove(name)
+      if not names:
+        self.docs[doc].pop(label,None)
+  def lookup(self,label,doc):
+    '''
+    lookup(label,doc)
+    Returns the list of objects of doc with label.
+    '''
+    if doc.Name not in self.docs:
+      self.build(doc)
+    objs=[doc.getObject(name) for name in self.docs[doc.Name].get(label,[])]
+    if not objs or not all(o and o.Label==label for o in objs):
+      objs=doc.getObjectsByLabel(label) # missing or out of date
+      if objs:
+        self.build(doc)
+    return objs
+  # slots of document observer
+  def slotCreatedObject(self,obj):
+    self.add(obj)
+  def slotDeletedObject(self,obj):
+    self.remove(obj.Document.Name,obj.Name)
+  def slotChangedObject(self,obj,prop):
+    if prop=='Label':
+      doc=obj.Document.Name
+      if doc in self.labels and self.labels[doc].get(obj.Name)!=obj.Label:
+        self.remove(doc,obj.Name)
+        self.add(obj)
+  def slotFinishRestoreDocument(self,doc):
+    self.docs.pop(doc.Name,None)
+    self.labels.pop(doc.Name,None)
+  def slotDeletedDocument(self,doc):
+    self.slotFinishRestoreDocument(doc)
+
+index=labelIndex()
+if hasattr(FreeCAD,'addDocumentObserver'):
+  FreeCAD.addDocumentObserver(index)
+else:
+  index=None
+
+def getObjectsByLabel(label,doc=None):
+  '''
+  getObjectsByLabel(label,doc=None)
+  Returns the list of objects with label in doc (default the active
+  document), as Document.getObjectsByLabel() but without scanning it.
+  '''
+  if not doc:
+    doc=FreeCAD.ActiveDocument
+  if index:
+    return index.lookup(label,doc)
+  return doc.getObjectsByLabel(label)
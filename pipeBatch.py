@@ -0,0 +1,108 @@
+#(c) 2018 R. T. LGPL: part of Flamingo tools w.b. for FreeCAD
+
+__title__="pypeTools batch"
+__author__="oddtopus"
+__url__="github.com/oddtopus/flamingo"
+__license__="LGPL 3"
+__doc__='''
+Generation of pypelines without GUI, from files of routes.
+It runs also in FreeCADCmd:
+  FreeCADCmd -c "import pipeBatch; pipeBatch.run('routes.json','plant.FCStd')"
+or
+  FreeCADCmd pipeBatch.py routes.csv plant.FCStd
+
+Routes in .json: a list of dictionaries like
+  {"name": "L101", "DN": "DN50", "PRating": "SCH-STD",
+   "points": [[0,0,0], [1000,0,0], [1000,800,0]]}
+with optional "type" ("line" -> PypeLine2, default, or "branch" -> PypeBranch2),
+"OD", "thk" and "BR". If OD and thk are missing, they are read in the
+table Pipe_<PRating>.csv for DN.
+Routes in .csv (";" separated, one row for each point, as the tables):
+  name;DN;PRating;x;y;z[;type;OD;thk;BR]
+rows with the same name are the points of the same route, in their order.
+'''
+
+import FreeCAD, Part, csv, json
+from os.path import splitext, abspath
+
+def readRoutes(fileName):
+  '''
+  readRoutes(fileName)
+  Returns the list of routes (dictionaries) read from the .json or .csv fileName.
+  '''
+  if splitext(fileName)[1].lower()=='.json':
+    f=open(fileName,'r')
+    routes=json.load(f)
+    f.close()
+    return routes
+  routes=list()
+  byName=dict()
+  f=open(fileName,'r')
+  for row in csv.DictReader(f,delimiter=';'):
+    name=row['name']
+    if name not in byName:
+      route=dict([(k,v) for k,v in row.items() if k in ['name','DN','PRating','type','OD','thk','BR'] and v])
+      route['points']=list()
+      byName[name]=route
+      routes.append(route)
+    byName[name]['points'].append([float(row[k]) for k in ['x','y','z']])
+  f.close()
+  return routes
+
+def buildRoute(route, doc=None):
+  '''
+  buildRoute(route, doc=None)
+  Adds to doc (default the active document) the path and the pypeline
+  (PypeLine2 or PypeBranch2) of one route. Returns the pypeline.
+  '''
+  import pipeCmd, catalog
+  if doc:
+    FreeCAD.setActiveDocument(doc.Name) # pypeTools work on the active document
+  else:
+    doc=FreeCAD.ActiveDocument
+  name=route['name']
+  DN=route.get('DN','DN50')
+  PRating=route.get('PRating','SCH-STD')
+  OD,thk=route.get('OD'),route.get('thk')
+  if not (OD and thk):
+    row=catalog.find('Pipe',PRating,DN,numeric=True)
+    if not row:
+      raise ValueError('%s: size %s not found in Pipe_%s.csv' %(name,DN,PRating))
+    OD,thk=row['OD'],row['thk']
+  BR=route.get('BR') and float(route['BR'])
+  points=[FreeCAD.Vector(*[float(x) for x in p]) for p in route['points']]
+  path=doc.addObject('Part::Feature',name+'_path')
+  path.Shape=Part.makePolygon(points)
+  if route.get('type','line')=='branch':
+    pl=pipeCmd.makeBranch(path,DN,PRating,float(OD),float(thk),BR,name)
+  else:
+    pl=pipeCmd.makePypeLine2(DN,PRating,float(OD),float(thk),BR,name,base=path)
+  return pl
+
+def run(routesFile, outFile, recompute=True):
+  '''
+  run(routesFile, outFile, recompute=True)
+  Creates a new document with the pypelines of all the routes in
+  routesFile and saves it as outFile. Returns the number of routes
+  that failed.
+  '''
+  doc=FreeCAD.newDocument()
+  errors=0
+  for route in readRoutes(routesFile):
+    try:
+      buildRoute(route,doc)
+    except Exception as e:
+      errors+=1
+      FreeCAD.Console.PrintError('Route %s not built: %s\n' %(route.get('name'),e))
+  if recompute:
+    doc.recompute()
+  doc.saveAs(abspath(outFile))
+  FreeCAD.Console.PrintMessage('%s saved (%i errors)\n' %(outFile,errors))
+  return errors
+
+if __name__=='__main__':
+  import sys
+  if len(sys.argv)>2:
+    run(sys.argv[-2],sys.argv[-1])
+  else:
+    FreeCAD.Console.PrintError('Usage: FreeCADCmd pipeBatch.py <routes.csv|.json> <file.FCStd>\n')
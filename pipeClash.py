@@ -0,0 +1,226 @@
+#(c) 2018 R. T. LGPL: part of Flamingo tools w.b. for FreeCAD
+
+__title__="pypeTools clash detection"
+__author__="oddtopus"
+__url__="github.com/oddtopus/flamingo"
+__license__="LGPL 3"
+__doc__='''
+Detection of clashes among pypes and frame beams.
+The candidate pairs are found by a bounding-volume hierarchy of the
+bounding boxes of components (broad phase); pairs of Pipes are then
+discarded with the distance of their axes (capsules of radius OD/2).
+Only the remaining pairs are checked with the shapes (distToShape and
+common), so that plants with many thousands of components are checked
+with few OCC operations:
+  report=pipeClash.clashes(clearance=50)
+Each clash is a dictionary:
+  {'a': <Name>, 'b': <Name>, 'type': 'interference', 'touch' or 'clearance',
+   'distance': <float>, 'volume': <float>}
+Pypes connected by their ports can touch each other: only connected
+Pipes whose capsules overlap deeper than their wall are checked for
+interference with common().
+'''
+
+import FreeCAD
+
+LEAF=4        # max items in the leaves of the tree
+VOLUME_TOL=1. # mm3: smaller common volumes are contacts
+
+def isComponent(o):
+  'True if o is a pype (not a PypeLine or PypeBranch) or a frame beam'
+  if not hasattr(o,'Shape'):
+    return False
+  if hasattr(o,'PType'):
+    return o.PType not in ['PypeLine','PypeBranch']
+  return o.TypeId=="Part::FeaturePython" and hasattr(o,"Height") and hasattr(o,"Profile")
+
+def box(o,margin=0.):
+  'Returns the bounding box of o as a tuple (xmin,ymin,zmin,xmax,ymax,zmax) enlarged by margin'
+  bb=o.Shape.BoundBox
+  return (bb.XMin-margin,bb.YMin-margin,bb.ZMin-margin,bb.XMax+margin,bb.YMax+margin,bb.ZMax+margin)
+
+def capsule(o):
+  'Returns (start, end, radius) of the axis of a Pipe, else None'
+  if getattr(o,'PType','')!='Pipe':
+    return None
+  Z=o.Placement.Rotation.multVec(FreeCAD.Vector(0,0,1))
+  p0=o.Placement.Base
+  return tuple(p0),tuple(p0+Z*float(o.Height)),float(o.OD)/2
+
+def segmentsDistance(a0,a1,b0,b1):
+  'Returns the minimum distance between the segments a0-a1 and b0-b1 (tuples)'
+  d1=[a1[i]-a0[i] for i in range(3)]
+  d2=[b1[i]-b0[i] for i in range(3)]
+  r=[a0[i]-b0[i] for i in range(3)]
+  dot=lambda u,v: u[0]*v[0]+u[1]*v[1]+u[2]*v[2]
+  a,e,f=dot(d1,d1),dot(d2,d2),dot(d2,r)
+  clamp=lambda x: min(max(x,0.),1.)
+  if a<=1e-12 and e<=1e-12:
+    s=t=0.
+  elif a<=1e-12:
+    s,t=0.,clamp(f/e)
+  else:
+    c=dot(d1,r)
+    if e<=1e-12:
+      s,t=clamp(-c/a),0.
+    else:
+      b=dot(d1,d2)
+      den=a*e-b*b
+      s=clamp((b*f-c*e)/den) if den>1e-12 else 0.
+      t=(b*s+f)/e
+      if t<0.:
+        s,t=clamp(-c/a),0.
+      elif t>1.:
+        s,t=clamp((b-c)/a),1.
+  v=[r[i]+d1[i]*s-d2[i]*t for i in range(3)]
+  return dot(v,v)**.5
+
+def penetration(ca,cb):
+  '''
+  penetration(ca, cb)
+  Returns how deep the capsules ca and cb (see capsule()) overlap: for
+  parallel axes, the overlap along them (0 for pipes end to end), else
+  the sum of radii less the distance of the axes.
+  '''
+  (a0,a1,ra),(b0,b1,rb)=ca,cb
+  dot=lambda u,v: u[0]*v[0]+u[1]*v[1]+u[2]*v[2]
+  d1=[a1[i]-a0[i] for i in range(3)]
+  d2=[b1[i]-b0[i] for i in range(3)]
+  L,M=dot(d1,d1)**.5,dot(d2,d2)**.5
+  if L>1e-9 and M>1e-9 and abs(dot(d1,d2))/(L*M)>0.9999:
+    u=[x/L for x in d1]
+    r0=[b0[i]-a0[i] for i in range(3)]
+    t0,t1=dot(u,r0),dot(u,[b1[i]-a0[i] for i in range(3)])
+    lateral=dot(r0,r0)-t0**2
+    lateral=max(lateral,0.)**.5
+    axial=min(L,max(t0,t1))-max(0.,min(t0,t1))
+    return max(min(axial,ra+rb-lateral),0.)
+  return ra+rb-segmentsDistance(a0,a1,b0,b1)
+
+class bvh(object):
+  '''
+  bvh(boxes)
+  Bounding-volume hierarchy of the list of boxes (see box()).
+  Nodes are tuples (box, left, right, indexes): indexes of boxes are
+  only in the leaves.
+  '''
+  def __init__(self,boxes):
+    self.boxes=boxes
+    self.root=self.node(list(range(len(boxes)))) if boxes else None
+  def node(self,items):
+    bb=self.merge(items)
+    if len(items)<=LEAF:
+      return (bb,None,None,items)
+    # split at the median of centers along the longest side
+    axis=max(range(3),key=lambda i: bb[i+3]-bb[i])
+    items.sort(key=lambda j: self.boxes[j][axis]+self.boxes[j][axis+3])
+    m=len(items)//2
+    return (bb,self.node(items[:m]),self.node(items[m:]),None)
+  def merge(self,items):
+    boxes=[self.boxes[j] for j in items]
+    return tuple([min([b[i] for b in boxes]) for i in range(3)]+[max([b[i] for b in boxes]) for i in range(3,6)])
+  def pairs(self):
+    'Returns the list of pairs of indexes (i,j) of boxes that overlap, i<j'
+    found=list()
+    if not self.root:
+      return found
+    stack=[(self.root,self.root)]
+    while stack:
+      n1,n2=stack.pop()
+      if n1 is not n2 and not overlap(n1[0],n2[0]):
+        continue
+      if n1[3] is not None and n2[3] is not None: # two leaves
+        for i in n1[3]:
+          for j in n2[3]:
+            if (i<j or (n1 is not n2 and i!=j)) and overlap(self.boxes[i],self.boxes[j]):
+              found.append((min(i,j),max(i,j)))
+      elif n1 is n2:
+        l,r=n1[1],n1[2]
+        stack.extend([(l,l),(r,r),(l,r)])
+      elif n2[3] is not None or (n1[3] is None and volume(n1[0])>=volume(n2[0])):
+        stack.extend([(n1[1],n2),(n1[2],n2)])
+      else:
+        stack.extend([(n1,n2[1]),(n1,n2[2])])
+    return found
+
+def overlap(b1,b2):
+  return b1[0]<=b2[3] and b2[0]<=b1[3] and b1[1]<=b2[4] and b2[1]<=b1[4] and b1[2]<=b2[5] and b2[2]<=b1[5]
+
+def volume(b):
+  return (b[3]-b[0])*(b[4]-b[1])*(b[5]-b[2])
+
+def candidates(objs,clearance=0.):
+  '''
+  candidates(objs, clearance=0.)
+  Returns the list of pairs of objs that may be closer than clearance:
+  overlapping boxes and, for Pipes, axes closer than the sum of radii.
+  '''
+  boxes=[box(o,clearance/2.) for o in objs]
+  caps=[capsule(o) for o in objs]
+  pairs=list()
+  for i,j in bvh(boxes).pairs():
+    if caps[i] and caps[j]:
+      (a0,a1,r1),(b0,b1,r2)=caps[i],caps[j]
+      if segmentsDistance(a0,a1,b0,b1)>r1+r2+clearance:
+        continue
+    pairs.append((objs[i],objs[j]))
+  return pairs
+
+def check(a,b,clearance=0.,connected=False):
+  '''
+  check(a, b, clearance=0., connected=False)
+  Checks the shapes of a and b and returns the dictionary of the clash,
+  or None.
+    connected: a and b are joined by their ports and can touch
+  Connected objects are checked with common() only if both are Pipes
+  whose capsules overlap deeper than the thinner wall (see penetration()).
+  '''
+  d=a.Shape.distToShape(b.Shape)[0]
+  if d>clearance or (d>0 and connected):
+    return None
+  if connected:
+    ca,cb=capsule(a),capsule(b)
+    if not (ca and cb) or penetration(ca,cb)<=min(float(a.thk),float(b.thk)):
+      return None
+  clash={'a':a.Name,'b':b.Name,'distance':d,'volume':0.}
+  if d>0:
+    clash['type']='clearance'
+    return clash
+  v=a.Shape.common(b.Shape).Volume
+  if v>VOLUME_TOL:
+    clash['type']='interference'
+    clash['volume']=v
+  elif connected:
+    return None
+  else:
+    clash['type']='touch'
+  return clash
+
+def clashes(objs=None,clearance=0.,doc=None):
+  '''
+  clashes(objs=None, clearance=0., doc=None)
+  Returns the list of clashes among objs (default all the pypes and
+  beams of doc, default the active document).
+    clearance: minimum distance required between components not connected
+  '''
+  import pipePorts
+  doc=doc or FreeCAD.ActiveDocument
+  if objs is None:
+    objs=doc.Objects
+  objs=[o for o in objs if isComponent(o) and not o.Shape.isNull()]
+  graph=pipePorts.getGraph(doc)
+  report=list()
+  for a,b in candidates(objs,clearance):
+    clash=check(a,b,clearance,b.Name in graph.connected(a))
+    if clash:
+      report.append(clash)
+  return report
+
+def printReport(report):
+  'Prints the list of clashes in the console'
+  for c in report:
+    if c['type']=='interference':
+      FreeCAD.Console.PrintWarning('%s - %s: interference (%.1f mm3)\n' %(c['a'],c['b'],c['volume']))
+    else:
+      FreeCAD.Console.PrintWarning('%s - %s: %s (%.1f mm)\n' %(c['a'],c['b'],c['type'],c['distance']))
+  FreeCAD.Console.PrintMessage('%i clashes found\n' %len(report))
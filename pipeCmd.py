@@ -5,7 +5,7 @@ __author__="oddtopus"
 __url__="github.com/oddtopus/flamingo"
 __license__="LGPL 3"
 
-import FreeCAD, FreeCADGui, Part, frameCmd, pipeFeatures
+import FreeCAD, FreeCADGui, Part, frameCmd, pipeFeatures, labelIndex
 from DraftVecUtils import rounded
 objToPaint=['Pipe','Elbow','Reduct','Flange','Cap']
 from math import degrees
@@ -17,16 +17,11 @@ def readTable(fileName="Pipe_SCH-STD.csv"):
   readTable(fileName)
   Returns the list of dictionaries read from file in ./tables
     fileName: the file name without path; default="Pipe_SCH-STD.csv" 
+  The file is parsed once by the catalog: the dictionaries are shared.
   '''
-  from os.path import join, dirname, abspath
-  import csv
-  f=open(join(dirname(abspath(__file__)),"tables",fileName),'r')
-  reader=csv.DictReader(f,delimiter=';')
-  table=[]
-  for row in reader:
-    table.append(row)
-  f.close()
-  return table
+  import catalog
+  from os.path import join
+  return list(catalog.getTable(join(catalog.tablesDir,fileName)).rows)
 
 def shapeReferenceAxis(obj=None, axObj=None):
   # function to get the reference axis of the shape for rotateTheTubeAx()
@@ -63,10 +58,12 @@ def moveToPyLi(obj,plName):
   '''
   Move obj to the group of pypeLine plName
   '''
-  pl=FreeCAD.ActiveDocument.getObjectsByLabel(plName)[0]
-  group=FreeCAD.ActiveDocument.getObjectsByLabel(str(pl.Group))[0]
+  pl=labelIndex.getObjectsByLabel(plName)[0]
+  group=labelIndex.getObjectsByLabel(str(pl.Group))[0]
   group.addObject(obj)
-  if hasattr(obj,'PType'):
+  if hasattr(obj,'LOD') and hasattr(pl,'LOD') and obj.LOD!=pl.LOD:
+    obj.LOD=pl.LOD
+  if hasattr(obj,'PType') and pl.ViewObject:
     if obj.PType in objToPaint:
       obj.ViewObject.ShapeColor=pl.ViewObject.ShapeColor
     elif obj.PType == 'PypeBranch':
@@ -88,7 +85,9 @@ def portsDir(o):
   dirs=list()
   two_ways=['Pipe','Reduct','Flange']
   if hasattr(o,'PType'):
-    if o.PType in two_ways:
+    if hasattr(o,'Proxy') and hasattr(o.Proxy,'ports') and hasattr(o,'Placement'):
+      dirs=[rounded(o.Placement.Rotation.multVec(d)) for d in o.Proxy.ports(o)[1]]
+    elif o.PType in two_ways:
       dirs=[o.Placement.Rotation.multVec(p) for p in [FreeCAD.Vector(0,0,-1),FreeCAD.Vector(0,0,1)]]
     elif hasattr(o,'Ports') and hasattr(o,'Placement'): 
       dirs=list()
@@ -131,7 +130,7 @@ def makePipe(propList=[], pos=None, Z=None):
     pipeFeatures.Pipe(a,*propList)
   else:
     pipeFeatures.Pipe(a)
-  a.ViewObject.Proxy=0
+  if a.ViewObject: a.ViewObject.Proxy=0
   a.Placement.Base=pos
   rot=FreeCAD.Rotation(FreeCAD.Vector(0,0,1),Z)
   a.Placement.Rotation=rot.multiply(a.Placement.Rotation)
@@ -160,7 +159,7 @@ def makeElbow(propList=[], pos=None, Z=None):
     pipeFeatures.Elbow(a,*propList)
   else:
     pipeFeatures.Elbow(a)
-  a.ViewObject.Proxy=0
+  if a.ViewObject: a.ViewObject.Proxy=0
   a.Placement.Base=pos
   rot=FreeCAD.Rotation(FreeCAD.Vector(0,0,1),Z)
   #rot=FreeCAD.Rotation(FreeCAD.Vector(0,-1,0),Z)
@@ -246,7 +245,7 @@ def makeFlange(propList=[], pos=None, Z=None):
     pipeFeatures.Flange(a,*propList)
   else:
     pipeFeatures.Flange(a)
-  a.ViewObject.Proxy=0
+  if a.ViewObject: a.ViewObject.Proxy=0
   a.Placement.Base=pos
   rot=FreeCAD.Rotation(FreeCAD.Vector(0,0,1),Z)
   a.Placement.Rotation=rot.multiply(a.Placement.Rotation)
@@ -272,9 +271,8 @@ def makeReduct(propList=[], pos=None, Z=None, conc=True):
   if Z==None:
     Z=FreeCAD.Vector(0,0,1)
   a=FreeCAD.ActiveDocument.addObject("Part::FeaturePython","Riduz")
-  propList.append(conc)
-  pipeFeatures.Reduct(a,*propList)
-  a.ViewObject.Proxy=0
+  pipeFeatures.Reduct(a,*propList,conc=conc)
+  if a.ViewObject: a.ViewObject.Proxy=0
   a.Placement.Base=pos
   rot=FreeCAD.Rotation(FreeCAD.Vector(0,0,1),Z)
   a.Placement.Rotation=rot.multiply(a.Placement.Rotation)
@@ -302,7 +300,7 @@ def makeUbolt(propList=[], pos=None, Z=None):
     pipeFeatures.Ubolt(a,*propList)
   else:
     pipeFeatures.Ubolt(a)
-  a.ViewObject.Proxy=0
+  if a.ViewObject: a.ViewObject.Proxy=0
   a.Placement.Base=pos
   rot=FreeCAD.Rotation(FreeCAD.Vector(0,0,1),Z)
   a.Placement.Rotation=rot.multiply(a.Placement.Rotation)
@@ -346,12 +344,98 @@ def makeCap(propList=[], pos=None, Z=None):
     pipeFeatures.Cap(a,*propList)
   else:
     pipeFeatures.Cap(a)
-  a.ViewObject.Proxy=0
+  if a.ViewObject: a.ViewObject.Proxy=0
   a.Placement.Base=pos
   rot=FreeCAD.Rotation(FreeCAD.Vector(0,0,1),Z)
   a.Placement.Rotation=rot.multiply(a.Placement.Rotation)
   return a
 
+def makeMany(maker, propLists, positions=None, directions=None, recompute=True):
+  '''
+  makeMany(maker, propLists, positions=None, directions=None, recompute=True)
+  Adds many pype-objects with maker (i.e. makePipe) in one transaction,
+  without recomputing the document until all of them are created.
+    propLists: one propList for all the objects or one for each object
+    positions: sequence (list or NumPy array) of positions (x,y,z); default = 0,0,0
+    directions: sequence of orientations (x,y,z); default = 0,0,1
+    recompute (bool): recompute the document at the end
+  Objects with the same parameters share the same cached shape (see pipeShapes).
+  Returns the list of objects.
+  '''
+  def isList(x):
+    return isinstance(x,(list,tuple)) or type(x).__name__=='ndarray'
+  def vector(p):
+    if p is None: return None
+    return FreeCAD.Vector(*[float(x) for x in p])
+  def plain(props):
+    return [x.item() if hasattr(x,'item') else x for x in props]
+  if len(propLists) and isList(propLists[0]):
+    propLists=[plain(props) for props in propLists]
+  else:
+    propLists=[plain(propLists)]
+  n=max([len(x) for x in [propLists,positions,directions] if x is not None])
+  if positions is None: positions=[None]*n
+  if directions is None: directions=[None]*n
+  if len(propLists)==1: propLists=propLists*n
+  if not len(propLists)==len(positions)==len(directions)==n:
+    raise ValueError('the lists of properties, positions and directions have different lengths')
+  doc=FreeCAD.ActiveDocument
+  frozen=getattr(doc,'RecomputesFrozen',None)
+  if frozen is not None: doc.RecomputesFrozen=True
+  doc.openTransaction('Insert '+maker.__name__[4:]+'s')
+  objs=list()
+  try:
+    for i in range(n):
+      objs.append(maker(list(propLists[i]),vector(positions[i]),vector(directions[i]))) # makers may modify their list
+  finally:
+    doc.commitTransaction()
+    if frozen is not None: doc.RecomputesFrozen=frozen
+  if recompute:
+    doc.recompute()
+  return objs
+
+def makePipes(propLists, positions=None, directions=None, recompute=True):
+  'Adds many Pipe objects at once: see makeMany() and makePipe()'
+  return makeMany(makePipe,propLists,positions,directions,recompute)
+
+def makeElbows(propLists, positions=None, directions=None, recompute=True):
+  'Adds many Elbow objects at once: see makeMany() and makeElbow()'
+  return makeMany(makeElbow,propLists,positions,directions,recompute)
+
+def makeFlanges(propLists, positions=None, directions=None, recompute=True):
+  'Adds many Flange objects at once: see makeMany() and makeFlange()'
+  return makeMany(makeFlange,propLists,positions,directions,recompute)
+
+def makeReducts(propLists, positions=None, directions=None, recompute=True):
+  'Adds many Reduct objects at once: see makeMany() and makeReduct()'
+  return makeMany(makeReduct,propLists,positions,directions,recompute)
+
+def makeCaps(propLists, positions=None, directions=None, recompute=True):
+  'Adds many Cap objects at once: see makeMany() and makeCap()'
+  return makeMany(makeCap,propLists,positions,directions,recompute)
+
+def makeValves(propLists, positions=None, directions=None, recompute=True):
+  'Adds many Valve objects at once: see makeMany() and makeValve()'
+  return makeMany(makeValve,propLists,positions,directions,recompute)
+
+def prebuild(objs, processes=None):
+  '''
+  prebuild(objs, processes=None)
+  Builds the shapes of the pype-objects objs that need to be rebuilt
+  with pipeShapes.buildMany(), in a pool of processes if BuildProcesses
+  in preferences (or processes) is more than 1 and the GUI is not up:
+  then the recompute of the document only copies them from the cache.
+  '''
+  import pipeShapes
+  tasks=list()
+  for o in objs:
+    if hasattr(o,'Proxy') and hasattr(o.Proxy,'shapeArgs'):
+      builder,params=o.Proxy.shapeArgs(o)
+      if builder and (o.Shape.isNull() or getattr(o.Proxy,'Fingerprint',None)!=pipeShapes.fingerprint(builder.__name__,*params)):
+        tasks.append((builder.__name__,params))
+  if tasks:
+    pipeShapes.buildMany(tasks,processes)
+
 def makeW():
   edges=frameCmd.edges()
   if len(edges)>1:
@@ -380,10 +464,11 @@ def makeW():
   else:
     return None
 
-def makePypeLine2(DN="DN50",PRating="SCH-STD",OD=60.3,thk=3,BR=None, lab="Tubatura", pl=None, color=(0.8,0.8,0.8)):
+def makePypeLine2(DN="DN50",PRating="SCH-STD",OD=60.3,thk=3,BR=None, lab="Tubatura", pl=None, color=(0.8,0.8,0.8), base=None):
   '''
-  makePypeLine2(DN="DN50",PRating="SCH-STD",OD=60.3,thk=3,BR=None, lab="Tubatura",pl=None, color=(0.8,0.8,0.8))
-  Adds a PypeLine2 object creating pipes over the selected edges.
+  makePypeLine2(DN="DN50",PRating="SCH-STD",OD=60.3,thk=3,BR=None, lab="Tubatura",pl=None, color=(0.8,0.8,0.8), base=None)
+  Adds a PypeLine2 object creating pipes over the selected edges
+  or over the edges of base, if given (it works also without GUI).
   Default tube is "DN50", "SCH-STD"
   Bending Radius is set to 0.75*OD.
   '''
@@ -393,9 +478,13 @@ def makePypeLine2(DN="DN50",PRating="SCH-STD",OD=60.3,thk=3,BR=None, lab="Tubatu
   if not pl:
     a=FreeCAD.ActiveDocument.addObject("Part::FeaturePython",lab)
     pipeFeatures.PypeLine2(a,DN,PRating,OD,thk,BR, lab)
-    pipeFeatures.ViewProviderPypeLine(a.ViewObject) # a.ViewObject.Proxy=0
-    a.ViewObject.ShapeColor=color
-    if len(FreeCADGui.Selection.getSelection())==1:
+    if a.ViewObject:
+      pipeFeatures.ViewProviderPypeLine(a.ViewObject) # a.ViewObject.Proxy=0
+      a.ViewObject.ShapeColor=color
+    if base:
+      a.Base=base
+      a.Proxy.update(a)
+    elif len(FreeCADGui.Selection.getSelection())==1:
       obj=FreeCADGui.Selection.getSelection()[0]
       isWire=hasattr(obj,'Shape') and type(obj.Shape)==Part.Wire
       isSketch=hasattr(obj,'TypeId') and obj.TypeId=='Sketcher::SketchObject'
@@ -411,8 +500,8 @@ def makePypeLine2(DN="DN50",PRating="SCH-STD",OD=60.3,thk=3,BR=None, lab="Tubatu
       a.Base=path
       a.Proxy.update(a)
   else:
-    a=FreeCAD.ActiveDocument.getObjectsByLabel(pl)[0]
-    group=FreeCAD.ActiveDocument.getObjectsByLabel(a.Group)[0]
+    a=labelIndex.getObjectsByLabel(pl)[0]
+    group=labelIndex.getObjectsByLabel(a.Group)[0]
     a.Proxy.update(a,frameCmd.edges())
     FreeCAD.Console.PrintWarning("Objects added to pypeline's group "+a.Group+"\n")
   return a
@@ -424,7 +513,7 @@ def makeBranch(base=None, DN="DN50",PRating="SCH-STD",OD=60.3,thk=3,BR=None, lab
   '''
   if not BR:
     BR=0.75*OD
-  if not base:
+  if not base and FreeCAD.GuiUp:
     if FreeCADGui.Selection.getSelection():
       obj=FreeCADGui.Selection.getSelection()[0]
       isWire=hasattr(obj,'Shape') and type(obj.Shape)==Part.Wire
@@ -439,7 +528,8 @@ def makeBranch(base=None, DN="DN50",PRating="SCH-STD",OD=60.3,thk=3,BR=None, lab
   if base:
     a=FreeCAD.ActiveDocument.addObject("Part::FeaturePython",lab)
     pipeFeatures.PypeBranch2(a,base,DN,PRating,OD,thk,BR)
-    pipeFeatures.ViewProviderPypeBranch(a.ViewObject)
+    if a.ViewObject:
+      pipeFeatures.ViewProviderPypeBranch(a.ViewObject)
     return a
   else:
     FreeCAD.Console.PrintError('Select a valid path.\n')
@@ -452,7 +542,7 @@ def updatePLColor(sel=None, color=None):
     if hasattr(pl,'PType') and pl.PType=='PypeLine':
       if not color:
         color=pl.ViewObject.ShapeColor
-      group=FreeCAD.activeDocument().getObjectsByLabel(pl.Group)[0]
+      group=labelIndex.getObjectsByLabel(pl.Group)[0]
       for o in group.OutList:
         if hasattr(o,'PType'):
           if o.PType in objToPaint: 
@@ -463,6 +553,29 @@ def updatePLColor(sel=None, color=None):
   else:
     FreeCAD.Console.PrintError('Select first one pype line\n')
 
+def setLOD(objs=None, lod='Full'):
+  '''
+  setLOD(objs=None, lod='Full')
+  Sets the level of detail of the pype-objects objs:
+    lod='Full': complete geometry, for drawings and export
+    lod='Proxy': lightweight geometry, for large models
+  PypeLines and PypeBranches pass it to all their pieces.
+  If objs is None, it takes the selected objects.
+  '''
+  if objs==None:
+    objs=FreeCADGui.Selection.getSelection()
+  for o in objs:
+    if not hasattr(o,'PType'): continue
+    pieces=[o]
+    if o.PType=='PypeLine':
+      for group in labelIndex.getObjectsByLabel(o.Group)[:1]:
+        pieces+=[p for p in group.OutList if p!=o]
+    elif o.PType=='PypeBranch':
+      pieces+=[FreeCAD.ActiveDocument.getObject(name) for name in o.Tubes+o.Curves]
+    for p in pieces:
+      if p and hasattr(p,'LOD') and p.LOD!=lod:
+        p.LOD=lod
+
 def alignTheTube(): 
   '''
   Mates the selected 2 circular edges
@@ -613,28 +726,35 @@ def placeThePype(pypeObject, port=0, target=None, targetPort=0):
     port: an optional port of pypeObject
   Aligns pypeObject's Placement to the Port of another pype which is selected in the viewport.
   The pype shall be selected to the circular edge nearest to the port concerned.
+  If nothing is selected, it's aligned to the closest open end of the model
+  within SnapODs (preferences, default 3) times its size, if any.
   '''
   pos=Z=FreeCAD.Vector()
   if target and hasattr(target,'PType') and hasattr(target,'Ports'): # target is given
     pos=portsPos(target)[targetPort]
     Z=portsDir(target)[targetPort]
   else: # find target
-    try:
-      selex=FreeCADGui.Selection.getSelectionEx()
+    selex=FreeCADGui.Selection.getSelectionEx()
+    if not (selex and selex[0].SubObjects): # nothing selected: snap to the closest open end nearby
+      size=float(getattr(pypeObject,'OD',0) or getattr(pypeObject,'D',0) or 100)
+      radius=size*FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/flamingo").GetFloat('SnapODs',3.)
+      found=nearestOpenPort(portsPos(pypeObject)[port],[pypeObject.Name],radius)
+      if not found:
+        FreeCAD.Console.PrintError('No geometry selected and no open end within %.0f mm\n' %radius)
+        return
+      pos,Z=found[2:]
+    else:
       target=selex[0].Object
       so=selex[0].SubObjects[0]
-    except:
-      FreeCAD.Console.PrintError('No geometry selected\n')
-      return
-    if type(so)==Part.Vertex: pick=so.Point
-    else: pick=so.CenterOfMass
-    if hasattr(target,'PType') and hasattr(target,'Ports'): # ...selection is another pype-object
-      pos, Z = nearestPort(target, pick)[1:]
-    elif frameCmd.edges([selex[0]]): # one or more edges selected...
-      edge=frameCmd.edges([selex[0]])[0]
-      if edge.curvatureAt(0)!=0: # ...and the first is curve
-        pos=edge.centerOfCurvatureAt(0)
-        Z=edge.tangentAt(0).cross(edge.normalAt(0))
+      if type(so)==Part.Vertex: pick=so.Point
+      else: pick=so.CenterOfMass
+      if hasattr(target,'PType') and hasattr(target,'Ports'): # ...selection is another pype-object
+        pos, Z = nearestPort(target, pick)[1:]
+      elif frameCmd.edges([selex[0]]): # one or more edges selected...
+        edge=frameCmd.edges([selex[0]])[0]
+        if edge.curvatureAt(0)!=0: # ...and the first is curve
+          pos=edge.centerOfCurvatureAt(0)
+          Z=edge.tangentAt(0).cross(edge.normalAt(0))
   # now place pypeObject on target
   pOport=pypeObject.Ports[port]
   if pOport==FreeCAD.Vector():
@@ -642,6 +762,38 @@ def placeThePype(pypeObject, port=0, target=None, targetPort=0):
     if pOport==FreeCAD.Vector(): pOport=FreeCAD.Vector(0,0,-1)
   pypeObject.Placement=FreeCAD.Placement(pos+Z*pOport.Length,FreeCAD.Rotation(pOport*-1,Z))
 
+def nearestOpenPort(point, exclude=[], radius=None):
+  '''
+  nearestOpenPort(point, exclude=[], radius=None)
+  Returns (object, port number, position, direction) of the port not
+  connected nearest to point in the whole active document, or None.
+    exclude: list of Names of objects whose ports are skipped
+    radius: optional maximum distance from point
+  '''
+  import pipePorts
+  g=pipePorts.getGraph()
+  if radius is None:
+    found=g.nearest(point,1,True,exclude)
+  else:
+    found=g.within(point,radius,True,exclude)[:1]
+  if found:
+    name,i=found[0][1]
+    pos,Z=g.ports[(name,i)][:2]
+    return FreeCAD.ActiveDocument.getObject(name),i,FreeCAD.Vector(pos),FreeCAD.Vector(Z)
+
+def snapToPort(point):
+  '''
+  snapToPort(point)
+  Returns (position, direction) of the open port whose rim is nearest to
+  point (eg. a vertex of its circular edge), else (point, None).
+  '''
+  found=nearestOpenPort(point)
+  if found:
+    o,i,pos,Z=found
+    if (pos-point).Length<=float(getattr(o,'OD',0))/2+0.5:
+      return pos,Z
+  return point,None
+
 def nearestPort (pypeObject,point):
   try:
     pos=portsPos(pypeObject)[0]; Z=portsDir(pypeObject)[0]
@@ -787,7 +939,7 @@ def makeValve(propList=[], pos=None, Z=None):
     pipeFeatures.Valve(a,*propList)
   else:
     pipeFeatures.Valve(a)
-  a.ViewObject.Proxy=0
+  if a.ViewObject: a.ViewObject.Proxy=0
   a.Placement.Base=pos
   rot=FreeCAD.Rotation(FreeCAD.Vector(0,0,1),Z)
   a.Placement.Rotation=rot.multiply(a.Placement.Rotation)
@@ -7,13 +7,14 @@ __license__="LGPL 3"
 objs=['Pipe','Elbow','Reduct','Cap','Flange','Ubolt','Valve']
 metaObjs=['PypeLine','PypeBranch']
 
-import FreeCAD, FreeCADGui, Part, frameCmd, pipeCmd
+import FreeCAD, FreeCADGui, Part, frameCmd, pipeCmd, pipeShapes, labelIndex
 from copy import copy
 from os.path import join, dirname, abspath
 
 ################ CLASSES ###########################
 
 class pypeType(object):
+  portProps=[] # the properties that define the Ports
   def __init__(self,obj):
     obj.Proxy = self
     obj.addProperty("App::PropertyString","PType","PBase","Type of tubeFeature").PType
@@ -21,11 +22,52 @@ class pypeType(object):
     obj.addProperty("App::PropertyString","PSize","PBase","Nominal diameter").PSize
     obj.addProperty("App::PropertyVectorList","Ports","PBase","Ports position relative to the origin of Shape")
     obj.addProperty("App::PropertyFloat","Kv","PBase","Flow factor (m3/h/bar)").Kv
+    obj.addProperty("App::PropertyEnumeration","LOD","PBase","Level of detail: full geometry or lightweight proxy").LOD=['Full','Proxy']
+    lod=pipeShapes.getParams().GetString('LOD','Full')
+    if lod in obj.getEnumerationsOfProperty('LOD'):
+      obj.LOD=lod
     obj.addExtension("Part::AttachExtensionPython",obj)
     #self.obj=obj sostituire con obj.Name e usare metodi per recuperare obj
     self.Name=obj.Name
   def execute(self, fp):
     fp.positionBySupport() # to recomute placement according the Support
+  def isProxy(self, fp):
+    'True if fp shall be drawn with proxy geometry'
+    return hasattr(fp,'LOD') and fp.LOD=='Proxy'
+  def ports(self, fp):
+    '''
+    ports(fp)
+      Returns ([<portPos>], [<portDir>]) of fp in its own frame, calculated
+      from its properties without building the shape.
+    '''
+    return [], []
+  def updatePorts(self, fp):
+    'Sets fp.Ports from ports(), if all the portProps are defined'
+    if all(hasattr(fp,prop) for prop in self.portProps):
+      ports=self.ports(fp)[0]
+      if ports!=list(fp.Ports):
+        fp.Ports=ports
+  def onChanged(self, fp, prop):
+    if prop in self.portProps:
+      self.updatePorts(fp)
+  def shapeArgs(self, fp):
+    '''
+    shapeArgs(fp)
+      Returns (<builder>, <params>): the function of pipeShapes and its
+      arguments that build the shape of fp (None, () if it has no shape).
+    '''
+    return None, ()
+  def setShape(self, fp, builder, *params):
+    '''
+    setShape(fp, builder, *params)
+      Sets fp.Shape=builder(*params) only if the fingerprint of params 
+      differs from the one of the last build, so that recomputes due to 
+      changes of Placement or Support don't rebuild the geometry.
+    '''
+    fingerprint=pipeShapes.fingerprint(builder.__name__,*params)
+    if fp.Shape.isNull() or getattr(self,'Fingerprint',None)!=fingerprint:
+      fp.Shape=builder(*params)
+      self.Fingerprint=fingerprint
   def nearestPort (self,point=None):
     '''
     nearestPort (point=None)
@@ -64,6 +106,7 @@ class Pipe(pypeType):
     OD (float): outside diameter
     thk (float): shell thickness
     H (float): length of pipe'''
+  portProps=['Height']
   def __init__(self, obj,DN="DN50",OD=60.3,thk=3, H=100):
     # initialize the parent class
     super(Pipe,self).__init__(obj)
@@ -80,16 +123,20 @@ class Pipe(pypeType):
   def onChanged(self, fp, prop):
     if prop=='ID' and fp.ID<fp.OD:
       fp.thk=(fp.OD-fp.ID)/2
+    super(Pipe,self).onChanged(fp,prop)
+  def ports(self, fp):
+    return [FreeCAD.Vector(),FreeCAD.Vector(0,0,float(fp.Height))], [FreeCAD.Vector(0,0,-1),FreeCAD.Vector(0,0,1)]
+  def shapeArgs(self, fp):
+    thk=min(float(fp.thk),float(fp.OD)/2) # as execute() will set it
+    return pipeShapes.pipeShape, (fp.OD,thk,fp.Height,self.isProxy(fp))
   def execute(self, fp):
     if fp.thk>fp.OD/2:
       fp.thk=fp.OD/2
     fp.ID=fp.OD-2*fp.thk
     fp.Profile=str(fp.OD)+"x"+str(fp.thk)
-    if fp.ID:
-      fp.Shape = Part.makeCylinder(fp.OD/2,fp.Height).cut(Part.makeCylinder(fp.ID/2,fp.Height))
-    else:
-      fp.Shape = Part.makeCylinder(fp.OD/2,fp.Height)
-    fp.Ports=[FreeCAD.Vector(),FreeCAD.Vector(0,0,float(fp.Height))]
+    builder,params=self.shapeArgs(fp)
+    self.setShape(fp,builder,*params)
+    self.updatePorts(fp)
     super(Pipe,self).execute(fp) # perform common operations
 
 class Elbow(pypeType):
@@ -101,6 +148,7 @@ class Elbow(pypeType):
     thk (float): shell thickness
     BA (float): bend angle
     BR (float): bend radius'''
+  portProps=['BendAngle','BendRadius']
   def __init__(self, obj,DN="DN50",OD=60.3,thk=3,BA=90,BR=45.225):
     # initialize the parent class
     super(Elbow,self).__init__(obj)
@@ -116,39 +164,28 @@ class Elbow(pypeType):
     obj.addProperty("App::PropertyLength","BendRadius","Elbow","Bend Radius").BendRadius=BR
     obj.addProperty("App::PropertyString","Profile","Elbow","Section dim.").Profile=str(obj.OD)+"x"+str(obj.thk)
     #obj.Ports=[FreeCAD.Vector(1,0,0),FreeCAD.Vector(0,1,0)]
-    self.execute(obj)
+    self.updatePorts(obj) # the shape is built at the first recompute
   def onChanged(self, fp, prop):
     if prop=='ID' and fp.ID<fp.OD:
       fp.thk=(fp.OD-fp.ID)/2
+    if prop in self.portProps and hasattr(fp,'BendRadius') and fp.BendAngle<180:
+      self.updatePorts(fp)
+  def ports(self, fp):
+    C,ports,dirs=pipeShapes.elbowGeometry(pipeShapes.quantizeAngle(fp.BendAngle),fp.BendRadius)
+    return ports, [dirs[0].negative(),dirs[1]]
+  def shapeArgs(self, fp):
+    thk=min(float(fp.thk),float(fp.OD)/2) # as execute() will set it
+    return pipeShapes.elbowShape, (fp.OD,thk,pipeShapes.quantizeAngle(fp.BendAngle),fp.BendRadius,self.isProxy(fp))
   def execute(self, fp):
     if fp.BendAngle<180:
       if fp.thk>fp.OD/2:
         fp.thk=fp.OD/2
       fp.ID=fp.OD-2*fp.thk
       fp.Profile=str(fp.OD)+"x"+str(fp.thk)
-      CenterOfBend=FreeCAD.Vector(fp.BendRadius,fp.BendRadius,0)
-      ## make center-line ##
-      R=Part.makeCircle(fp.BendRadius,CenterOfBend,FreeCAD.Vector(0,0,1),225-float(fp.BendAngle)/2,225+float(fp.BendAngle)/2)
-      ## move the cl so that Placement.Base is the center of elbow ##
-      from math import pi, cos, sqrt
-      d=(fp.BendRadius*sqrt(2)-fp.BendRadius/cos(fp.BendAngle/180*pi/2))
-      P=FreeCAD.Vector(-d*cos(pi/4),-d*cos(pi/4),0)
-      R.translate(P)
-      ## calculate Ports position ##
-      fp.Ports=[R.valueAt(R.FirstParameter),R.valueAt(R.LastParameter)]
-      ## make the shape of the elbow ##
-      c=Part.makeCircle(fp.OD/2,fp.Ports[0],R.tangentAt(R.FirstParameter)*-1)
-      b=Part.makeSweepSurface(R,c)
-      p1=Part.Face(Part.Wire(c))
-      p2=Part.Face(Part.Wire(Part.makeCircle(fp.OD/2,fp.Ports[1],R.tangentAt(R.LastParameter))))
-      sol=Part.Solid(Part.Shell([b,p1,p2]))
-      planeFaces=[f for f in sol.Faces if type(f.Surface)==Part.Plane]
-      #elbow=sol.makeThickness(planeFaces,-fp.thk,1.e-3)
-      #fp.Shape = elbow
-      if fp.thk<fp.OD/2:
-        fp.Shape=sol.makeThickness(planeFaces,-fp.thk,1.e-3)
-      else:
-        fp.Shape=sol
+      ## the elbow in its canonical frame: Placement.Base is the center of elbow ##
+      builder,params=self.shapeArgs(fp)
+      self.setShape(fp,builder,*params)
+      self.updatePorts(fp)
       super(Elbow,self).execute(fp) # perform common operations
     
 class Flange(pypeType):
@@ -164,6 +201,7 @@ class Flange(pypeType):
     t (float): flange thickness
     n (int): nr. of bolts
   '''
+  portProps=['t']
   def __init__(self, obj,DN="DN50",FlangeType="SO",D=160,d=60.3,df=132,f=14, t=15, n=4):
     # initialize the parent class
     super(Flange,self).__init__(obj)
@@ -179,20 +217,14 @@ class Flange(pypeType):
     obj.addProperty("App::PropertyLength","f","Flange","Bolts hole diameter").f=f
     obj.addProperty("App::PropertyLength","t","Flange","Thickness of flange").t=t
     obj.addProperty("App::PropertyInteger","n","Flange","Nr. of bolts").n=n
-  def onChanged(self, fp, prop):
-    return None
+  def ports(self, fp):
+    return [FreeCAD.Vector(),FreeCAD.Vector(0,0,float(fp.t))], [FreeCAD.Vector(0,0,-1),FreeCAD.Vector(0,0,1)]
+  def shapeArgs(self, fp):
+    return pipeShapes.flangeShape, (fp.D,fp.d,fp.df,fp.f,fp.t,fp.n,self.isProxy(fp))
   def execute(self, fp):
-    base=Part.Face(Part.Wire(Part.makeCircle(fp.D/2)))
-    if fp.d>0:
-      base=base.cut(Part.Face(Part.Wire(Part.makeCircle(fp.d/2))))
-    if fp.n>0:
-      hole=Part.Face(Part.Wire(Part.makeCircle(fp.f/2,FreeCAD.Vector(fp.df/2,0,0),FreeCAD.Vector(0,0,1))))
-      hole.rotate(FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1),360.0/fp.n/2)
-      for i in list(range(fp.n)):
-        base=base.cut(hole)
-        hole.rotate(FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1),360.0/fp.n)
-    fp.Shape = base.extrude(FreeCAD.Vector(0,0,fp.t))
-    fp.Ports=[FreeCAD.Vector(),FreeCAD.Vector(0,0,float(fp.t))]
+    builder,params=self.shapeArgs(fp)
+    self.setShape(fp,builder,*params)
+    self.updatePorts(fp)
     super(Flange,self).execute(fp) # perform common operations
     
 class Reduct(pypeType):
@@ -209,6 +241,7 @@ class Reduct(pypeType):
   If thk2 is None or 0, the same thickness is used at both ends.
   If H is None or 0, the length of the reduction is calculated as 3x(OD-OD2).
     '''
+  portProps=['OD','OD2','calcH','Height','conc']
   def __init__(self, obj,DN="DN50",OD=60.3,OD2=48.3,thk=3, thk2=None, H=None, conc=True):
     # initialize the parent class
     super(Reduct,self).__init__(obj)
@@ -235,8 +268,21 @@ class Reduct(pypeType):
       obj.Height=float(H)
     obj.addProperty("App::PropertyString","Profile","Reduct","Section dim.").Profile=str(obj.OD)+"x"+str(obj.OD2)
     obj.addProperty("App::PropertyBool","conc","Reduct","Concentric or Eccentric").conc=conc
-  def onChanged(self, fp, prop):
-    return None
+  def ports(self, fp):
+    H=float(fp.Height)
+    if fp.calcH or H==0:
+      H=3*float(fp.OD-fp.OD2)
+    if fp.conc:
+      ports=[FreeCAD.Vector(),FreeCAD.Vector(0,0,H)]
+    else:
+      ports=[FreeCAD.Vector(),FreeCAD.Vector(float(fp.OD-fp.OD2)/2,0,H)]
+    return ports, [FreeCAD.Vector(0,0,-1),FreeCAD.Vector(0,0,1)]
+  def shapeArgs(self, fp):
+    # thicknesses and height as execute() will set them
+    thk=float(fp.thk) if fp.thk<=fp.OD/2 else float(fp.OD)/2.1
+    thk2=float(fp.thk2) if fp.thk2<=fp.OD2/2 else float(fp.OD2)/2.1
+    H=3*(float(fp.OD)-float(fp.OD2)) if fp.calcH or fp.Height==0 else fp.Height
+    return pipeShapes.reductShape, (fp.OD,fp.OD2,thk,thk2,H,fp.conc,self.isProxy(fp))
   def execute(self, fp):
     if fp.OD>fp.OD2:
       if fp.thk>fp.OD/2:
@@ -246,21 +292,9 @@ class Reduct(pypeType):
       if fp.calcH or fp.Height==0:
         fp.Height=3*(fp.OD-fp.OD2)
       fp.Profile=str(fp.OD)+"x"+str(fp.OD2)
-      if fp.conc:
-        fp.Shape = Part.makeCone(fp.OD/2,fp.OD2/2,fp.Height).cut(Part.makeCone(fp.OD/2-fp.thk,fp.OD2/2-fp.thk2,fp.Height))
-        fp.Ports=[FreeCAD.Vector(),FreeCAD.Vector(0,0,float(fp.Height))]
-      else:
-        C=Part.makeCircle(fp.OD/2,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1))
-        c=Part.makeCircle(fp.OD2/2,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1))
-        c.translate(FreeCAD.Vector((fp.OD-fp.OD2)/2,0,fp.Height))
-        sol=Part.makeLoft([c,C],True)
-        #planeFaces=[f for f in sol.Faces if type(f.Surface)==Part.Plane]
-        #fp.Shape= sol.makeThickness(planeFaces,-fp.thk,1.e-3)
-        C=Part.makeCircle(fp.OD/2-fp.thk,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1))
-        c=Part.makeCircle(fp.OD2/2-fp.thk2,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1))
-        c.translate(FreeCAD.Vector((fp.OD-fp.OD2)/2,0,fp.Height))
-        fp.Shape=sol.cut(Part.makeLoft([c,C],True))
-        fp.Ports=[FreeCAD.Vector(),FreeCAD.Vector((fp.OD-fp.OD2)/2,0,float(fp.Height))]
+      builder,params=self.shapeArgs(fp)
+      self.setShape(fp,builder,*params)
+      self.updatePorts(fp)
     super(Reduct,self).execute(fp) # perform common operations
     
 class Cap(pypeType):
@@ -282,23 +316,19 @@ class Cap(pypeType):
     obj.addProperty("App::PropertyLength","thk","Cap","Wall thickness").thk=thk
     obj.addProperty("App::PropertyLength","ID","Cap","Inside diameter").ID=obj.OD-2*obj.thk
     obj.addProperty("App::PropertyString","Profile","Cap","Section dim.").Profile=str(obj.OD)+"x"+str(obj.thk)
-  def onChanged(self, fp, prop):
-    return None
+  def ports(self, fp):
+    return [FreeCAD.Vector()], [FreeCAD.Vector(0,0,-1)]
+  def shapeArgs(self, fp):
+    thk=float(fp.thk) if fp.thk<=fp.OD/2 else float(fp.OD)/2.1 # as execute() will set it
+    return pipeShapes.capShape, (fp.OD,thk,self.isProxy(fp))
   def execute(self, fp):
     if fp.thk>fp.OD/2:
       fp.thk=fp.OD/2.1
     fp.ID=fp.OD-2*fp.thk
     fp.Profile=str(fp.OD)+"x"+str(fp.thk)
-    D=float(fp.OD)
-    s=float(fp.thk)
-    sfera=Part.makeSphere(0.8*D,FreeCAD.Vector(0,0,-(0.55*D-6*s)))
-    cilindro=Part.makeCylinder(D/2,D*1.7,FreeCAD.Vector(0,0,-(0.55*D-6*s+1)),FreeCAD.Vector(0,0,1))
-    common=sfera.common(cilindro)
-    fil=common.makeFillet(D/6.5,common.Edges)
-    cut=fil.cut(Part.makeCylinder(D*1.1,D*2,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,-1)))
-    cap=cut.makeThickness([f for f in cut.Faces if type(f.Surface)==Part.Plane],-s,1.e-3)
-    fp.Shape = cap
-    fp.Ports=[FreeCAD.Vector()]
+    builder,params=self.shapeArgs(fp)
+    self.setShape(fp,builder,*params)
+    self.updatePorts(fp)
     super(Cap,self).execute(fp) # perform common operations
     
 class PypeLine2(pypeType):
@@ -314,6 +344,8 @@ class PypeLine2(pypeType):
   and open paths, this usually leads to acceptable results.
   - Running "obj.Proxy.purge(obj)" deletes from the model all Pipes and Elbows 
   that belongs to the pype-line.  
+  - Running "obj.Proxy.check(obj)" before purging returns the segments of the 
+  "obj.Base" too short for the BendRadius, that would leave the pype-line empty.
   - It's possible to add other objects afterwards (such as Flange, Reduct...) 
   using the relevant insertion dialogs but remember that these won't be updated 
   when the .Base is changed and won't be deleted if the pype-line is purged.
@@ -348,11 +380,33 @@ class PypeLine2(pypeType):
       FreeCAD.Console.PrintWarning(fp.Label+' Base has changed to '+fp.Base.Label+'\n')
     if prop=='OD':
       fp.BendRadius=0.75*fp.OD
+    if prop=='LOD' and hasattr(fp,'Group'):
+      pipeCmd.setLOD([fp],fp.LOD)
   def purge(self,fp):
-    group=FreeCAD.activeDocument().getObjectsByLabel(fp.Group)[0]
+    group=labelIndex.getObjectsByLabel(fp.Group)[0]
     for o in group.OutList:
       if hasattr(o,'PType') and o.PType in ['Pipe','Elbow']:
         FreeCAD.activeDocument().removeObject(o.Name)
+  def check(self,fp,BR=None):
+    '''
+    check(fp,BR=None)
+      Returns the list of the segments (1, 2...) of the polyline of Base
+      too short for the bend radius BR (default fp.BendRadius): if it's not
+      empty, update() would draw nothing, so the pieces must not be purged.
+    '''
+    if not (hasattr(fp.Base,'Shape') and fp.Base.Shape.Edges):
+      return []
+    try:
+      import pipeRoute
+    except ImportError:
+      return []
+    points=pipeRoute.polyline(fp.Base.Shape.Edges)
+    if points is None:
+      return []
+    if BR is None:
+      BR=float(fp.BendRadius)
+    lengths=pipeRoute.solveRoute(points,BR)['lengths']
+    return [i+1 for i in range(len(lengths)) if lengths[i]<=0]
   def update(self,fp,edges=None):
     import pipeCmd, frameCmd
     from DraftVecUtils import rounded
@@ -362,6 +416,15 @@ class PypeLine2(pypeType):
       if not edges:
         FreeCAD.Console.PrintError('Base has not valid edges\n')
         return
+    points=None
+    try:
+      import pipeRoute
+      points=pipeRoute.polyline(edges)
+    except ImportError:
+      FreeCAD.Console.PrintWarning('NumPy not available: the pypeline is drawn edge by edge\n')
+    if points is not None:
+      self.draw(fp,points)
+      return
     pipes=list()
     for e in edges:
       #---Create the tube---
@@ -381,6 +444,38 @@ class PypeLine2(pypeType):
         frameCmd.extendTheBeam(p1,portA)
         frameCmd.extendTheBeam(p2,portB)
         pipeCmd.moveToPyLi(c,fp.Label)
+    pipeCmd.prebuild(labelIndex.getObjectsByLabel(fp.Group)[0].OutList)
+  def draw(self,fp,points):
+    '''
+    draw(fp,points)
+      Creates the pipes and curves along the polyline through points,
+      solved in one pass with pipeRoute.solveRoute().
+      If some segment is too short for the bend radius, nothing is created.
+    '''
+    import pipeRoute
+    route=pipeRoute.solveRoute(points,float(fp.BendRadius))
+    short=[i+1 for i in range(len(route['lengths'])) if route['lengths'][i]<=0]
+    if short:
+      FreeCAD.Console.PrintError(fp.Label+': segments %s are too short for the bend radius: nothing drawn\n' %short)
+      return
+    objs=list()
+    for i in range(len(route['lengths'])):
+      #---Create the tube---
+      p=pipeCmd.makePipe([fp.PSize,fp.OD,fp.thk,route['lengths'][i]],pos=FreeCAD.Vector(*route['starts'][i]),Z=FreeCAD.Vector(*route['directions'][i]))
+      p.PRating=fp.PRating
+      objs.append(p)
+      #---Create the curve---
+      if i<len(route['bends']) and route['bends'][i]:
+        c=pipeCmd.makeElbow([fp.PSize,fp.OD,fp.thk,route['angles'][i],fp.BendRadius])
+        c.PRating=fp.PRating
+        c.Placement=FreeCAD.Placement(FreeCAD.Vector(*route['elbowPos'][i]),FreeCAD.Rotation(*route['elbowRot'][i]))
+        objs.append(c)
+    group=labelIndex.getObjectsByLabel(fp.Group)[0]
+    for o in objs:
+      group.addObject(o)
+      if hasattr(fp,'LOD') and o.LOD!=fp.LOD: o.LOD=fp.LOD
+      if fp.ViewObject: o.ViewObject.ShapeColor=fp.ViewObject.ShapeColor
+    pipeCmd.prebuild(objs)
   def execute(self, fp):
     return None
 
@@ -416,15 +511,12 @@ class Ubolt():
     obj.addProperty("App::PropertyVectorList","Ports","PBase","Ports position relative to the origin of Shape")
   def onChanged(self, fp, prop):
     return None
+  def ports(self, fp):
+    return [FreeCAD.Vector(0,0,1)], [FreeCAD.Vector(0,0,1)]
   def execute(self, fp):
     fp.thread="M"+str(float(fp.d))
-    c=Part.makeCircle(fp.C/2,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1),0,180)
-    l1=Part.makeLine((fp.C/2,0,0),(fp.C/2,fp.C/2-fp.H,0))
-    l2=Part.makeLine((-fp.C/2,0,0),(-fp.C/2,fp.C/2-fp.H,0))
-    p=Part.Face(Part.Wire(Part.makeCircle(fp.d/2,c.valueAt(c.FirstParameter),c.tangentAt(c.FirstParameter))))
-    path=Part.Wire([c,l1,l2])
-    fp.Shape=path.makePipe(p)
-    fp.Ports=[FreeCAD.Vector(0,0,1)]
+    fp.Shape=pipeShapes.uboltShape(fp.C,fp.H,fp.d)
+    fp.Ports=self.ports(fp)[0]
 
 class Shell():
   '''
@@ -497,6 +589,7 @@ class Valve(pypeType):
     PRating (string): ! the valve's type !
     OD (float): outside diameter
     H (float): length of valve'''
+  portProps=['Height']
   def __init__(self, obj,DN="DN50",VType="ball",OD=72, ID=50, H=40, Kv=150):
     # initialize the parent class
     super(Valve,self).__init__(obj)
@@ -509,14 +602,15 @@ class Valve(pypeType):
     obj.addProperty("App::PropertyLength","OD","Valve","Outside diameter").OD=OD
     obj.addProperty("App::PropertyLength","ID","Valve","Inside diameter").ID=ID
     obj.addProperty("App::PropertyLength","Height","Valve","Length of tube").Height=H
+  def ports(self, fp):
+    return [FreeCAD.Vector(),FreeCAD.Vector(0,0,float(fp.Height))], [FreeCAD.Vector(0,0,-1),FreeCAD.Vector(0,0,1)]
+  def shapeArgs(self, fp):
+    ball=bool(fp.PRating.find('ball')+1 or fp.PRating.find('globe')+1)
+    return pipeShapes.valveShape, (fp.OD,fp.Height,ball,self.isProxy(fp))
   def execute(self, fp):
-    c=Part.makeCone(fp.OD/2,fp.OD/5,fp.Height/2)
-    v=c.fuse(c.mirror(FreeCAD.Vector(0,0,fp.Height/2),FreeCAD.Vector(0,0,1)))
-    if fp.PRating.find('ball')+1 or fp.PRating.find('globe')+1:
-      r=min(fp.Height*0.45,fp.OD/2)
-      v=v.fuse(Part.makeSphere(r,FreeCAD.Vector(0,0,fp.Height/2)))
-    fp.Shape = v
-    fp.Ports=[FreeCAD.Vector(),FreeCAD.Vector(0,0,float(fp.Height))]
+    builder,params=self.shapeArgs(fp)
+    self.setShape(fp,builder,*params)
+    self.updatePorts(fp)
     super(Valve,self).execute(fp) # perform common operations
     
 class PypeBranch2(pypeType): # use AttachExtensionPython
@@ -548,8 +642,12 @@ class PypeBranch2(pypeType): # use AttachExtensionPython
     obj.addExtension("App::GroupExtensionPython",obj)  # GROUP test in progress!
   def onChanged(self, fp, prop):
     if prop=='Base' and hasattr(fp,'OD') and hasattr(fp,'thk') and hasattr(fp,'BendRadius'):
-      self.purge(fp)
-      self.redraw(fp)
+      if not fp.Base:
+        self.purge(fp)
+      elif fp.Base.Shape.Edges and 'Restoring' not in getattr(fp,'State',[]):
+        data=self.edgesData(fp)
+        self.reconcile(fp,data)
+        self.adjust(fp,data)
     if prop=='BendRadius' and hasattr(fp,'Curves'):
       BR=fp.BendRadius
       for curve in [FreeCAD.ActiveDocument.getObject(name) for name in fp.Curves]:
@@ -564,72 +662,167 @@ class PypeBranch2(pypeType): # use AttachExtensionPython
       thk=fp.thk
       for obj in [FreeCAD.ActiveDocument.getObject(name) for name in fp.Tubes+fp.Curves]:
         if hasattr(obj,'thk'): obj.thk=thk
+    if prop=='LOD' and hasattr(fp,'Tubes') and hasattr(fp,'Curves'):
+      pipeCmd.setLOD([fp],fp.LOD)
+  def __getstate__(self):
+    state=dict(self.__dict__)
+    state.pop('edgesCache',None) # rebuilt from Base when needed
+    return state
+  def __setstate__(self,state):
+    self.__dict__.update(state)
   def execute(self, fp):
-    if len(fp.Tubes)!=len(fp.Base.Shape.Edges):
-      self.purge(fp)
-      self.redraw(fp)
-      return
+    data=self.edgesData(fp)
+    if len(fp.Tubes)!=len(data['lengths']) or len(fp.Curves)!=max(len(fp.Tubes)-1,0):
+      self.reconcile(fp,data)
+    self.adjust(fp,data)
+    self.EdgeKeys=data['keys']
+  def edgesData(self, fp):
+    '''
+    edgesData(fp)
+      Returns the dictionary of the lengths, tangents (at start), turning
+      angles (rad) and keys (see edgeKeys()) of the edges of Base.
+      It's calculated once for each shape of Base, recognized by its hashCode():
+      since fp.Base.Shape returns a copy, it's called once by execute() and
+      reconcile() and the data is passed down to the other methods.
+    '''
+    shape=fp.Base.Shape
+    key=(fp.Base.Name,shape.hashCode())
+    data=getattr(self,'edgesCache',None)
+    if not data or data['key']!=key:
+      edges=shape.Edges
+      tangents=[e.tangentAt(0) for e in edges]
+      data=self.edgesCache={'key':key,
+        'lengths':[e.Length for e in edges],
+        'tangents':tangents,
+        'angles':[tangents[i].getAngle(tangents[i+1]) for i in range(len(edges)-1)],
+        'keys':self.edgeKeys(edges)}
+    return data
+  def adjust(self, fp, data=None):
+    'Sets the length of tubes and the placement of curves according the edges of Base (or their edgesData())'
     from math import tan
-    for i in range(len(fp.Tubes)):
-      L=fp.Base.Shape.Edges[i].Length
-      R=fp.BendRadius
+    data=data or self.edgesData(fp)
+    R=float(fp.BendRadius)
+    trims=[R*tan(alfa/2) for alfa in data['angles']]
+    tubes=[FreeCAD.ActiveDocument.getObject(name) for name in fp.Tubes]
+    curves=[FreeCAD.ActiveDocument.getObject(name) for name in fp.Curves]
+    for i in range(len(tubes)):
+      L=data['lengths'][i]
       # adjust the curve
-      if i<len(fp.Curves):
-        c=FreeCAD.ActiveDocument.getObject(fp.Curves[i])
-        v1,v2=[e.tangentAt(0) for e in fp.Base.Shape.Edges[i:i+2]]
-        pipeCmd.placeTheElbow(c,v1,v2) 
-        alfa=float(v1.getAngle(v2))/2
-        L-=float(R*tan(alfa)) 
+      if i<len(curves):
+        v1,v2=[FreeCAD.Vector(v) for v in data['tangents'][i:i+2]]
+        pipeCmd.placeTheElbow(curves[i],v1,v2) 
+        L-=trims[i]
       # adjust the pipes
+      t=tubes[i]
       if i: 
-        v1,v2=[e.tangentAt(0) for e in fp.Base.Shape.Edges[i-1:i+1]]
-        alfa=float(v1.getAngle(v2))/2
-        tang=float(R*tan(alfa)) 
+        tang=trims[i-1]
         L-=tang
-        FreeCAD.ActiveDocument.getObject(fp.Tubes[i]).AttachmentOffset.Base=FreeCAD.Vector(0,0,tang)
-      FreeCAD.ActiveDocument.getObject(fp.Tubes[i]).Height=L
+        if t.AttachmentOffset.Base!=FreeCAD.Vector(0,0,tang):
+          t.AttachmentOffset.Base=FreeCAD.Vector(0,0,tang)
+      if abs(float(t.Height)-L)>1e-9:
+        t.Height=L
+  def edgeKeys(self, edges):
+    'Returns the end points of edges, rounded, to recognize them when the Base is modified'
+    keys=list()
+    for e in edges:
+      p0,p1=e.valueAt(e.FirstParameter),e.valueAt(e.LastParameter)
+      keys.append(tuple([round(x,6) for x in (p0.x,p0.y,p0.z,p1.x,p1.y,p1.z)]))
+    return keys
+  def makeTube(self, fp, i, L=None, offset=0, data=None):
+    'Creates the tube attached to the edge i of Base (data: its edgesData(), if at hand)'
+    if L is None:
+      L=(data or self.edgesData(fp))['lengths'][i]
+    t=pipeCmd.makePipe([fp.PSize,float(fp.OD),float(fp.thk),L])
+    t.PRating=fp.PRating
+    t.PSize=fp.PSize
+    if hasattr(fp,'LOD'): t.LOD=fp.LOD
+    t.Support = [(fp.Base,'Edge'+str(i+1))]
+    t.MapMode = 'NormalToEdge'
+    t.MapReversed = True
+    t.AttachmentOffset=FreeCAD.Placement(FreeCAD.Vector(0,0,offset),FreeCAD.Rotation())
+    return t
+  def makeCurve(self, fp, i, data=None):
+    'Creates the curve attached to the vertex between the edges i and i+1 of Base (data: its edgesData(), if at hand)'
+    from math import degrees
+    data=data or self.edgesData(fp)
+    v1,v2=[FreeCAD.Vector(v) for v in data['tangents'][i:i+2]]
+    c=pipeCmd.makeElbow([fp.PSize,float(fp.OD),float(fp.thk),degrees(data['angles'][i]),float(fp.BendRadius)])
+    c.PRating=fp.PRating
+    c.PSize=fp.PSize
+    if hasattr(fp,'LOD'): c.LOD=fp.LOD
+    c.MapReversed = False
+    c.Support = [(fp.Base,'Vertex'+str(i+2))]
+    c.MapMode = 'Translate'
+    pipeCmd.placeTheElbow(c,v1,v2)
+    return c
+  def reconcile(self, fp, data=None):
+    '''
+    reconcile(fp, data=None)
+      Matches the Tubes and Curves with the edges of Base after these have
+      been modified: the pieces of unchanged edges are kept (with their 
+      colors), those of new edges are created, those of removed edges are
+      deleted; then the Support of pieces is renumbered if edges have shifted.
+      If the edges of the last draw are unknown, pieces are matched by position.
+      data: the edgesData() of Base, if already at hand
+    '''
+    from difflib import SequenceMatcher
+    doc=FreeCAD.ActiveDocument
+    data=data or self.edgesData(fp)
+    new=data['keys']
+    old=[tuple(k) for k in getattr(self,'EdgeKeys',[])]
+    if len(old)!=len(fp.Tubes):
+      old=[None]*len(fp.Tubes)
+    def merge(names,old,new,make):
+      result=[None]*len(new)
+      for tag,i1,i2,j1,j2 in SequenceMatcher(None,old,new,autojunk=False).get_opcodes():
+        n=min(i2-i1,j2-j1)
+        result[j1:j1+n]=names[i1:i1+n]
+        for name in names[i1+n:i2]:
+          doc.removeObject(name)
+        for j in range(j1+n,j2):
+          result[j]=make(fp,j,data=data).Name
+      return result
+    tubes=merge(list(fp.Tubes),old,new,self.makeTube)
+    curves=list(fp.Curves)
+    oldJoints=list(zip(old[:-1],old[1:]))
+    if len(curves)!=len(oldJoints):
+      oldJoints=[None]*len(curves)
+    curves=merge(curves,oldJoints,list(zip(new[:-1],new[1:])),self.makeCurve)
+    for names,sub,first in [(tubes,'Edge',1),(curves,'Vertex',2)]:
+      for i in range(len(names)):
+        o=doc.getObject(names[i])
+        support=(fp.Base,sub+str(i+first))
+        subs=o.Support[0][1] if o.Support else None
+        if not isinstance(subs,(list,tuple)): subs=(subs,)
+        if not o.Support or o.Support[0][0]!=fp.Base or list(subs)!=[support[1]]:
+          o.Support=[support]
+    fp.Tubes=tubes
+    fp.Curves=curves
+    self.EdgeKeys=new
   def redraw(self,fp): 
-    from math import tan, degrees
+    from math import tan
     tubes=list()
     curves=list()
     if fp.Base:
-      for i in range(len(fp.Base.Shape.Edges)):
-        e=fp.Base.Shape.Edges[i]
-        L=e.Length
-        R=float(fp.BendRadius)
+      data=self.edgesData(fp)
+      R=float(fp.BendRadius)
+      trims=[R*tan(alfa/2) for alfa in data['angles']]
+      for i in range(len(data['lengths'])):
+        L=data['lengths'][i]
         offset=0
         #---Create the tube---
         if i>0: 
-          alfa=e.tangentAt(0).getAngle(fp.Base.Shape.Edges[i-1].tangentAt(0))/2
-          L-=R*tan(alfa)
-          offset=R*tan(alfa)
-        if i<(len(fp.Base.Shape.Edges)-1): 
-          alfa=e.tangentAt(0).getAngle(fp.Base.Shape.Edges[i+1].tangentAt(0))/2
-          L-=R*tan(alfa)
-        eSupport='Edge'+str(i+1)
-        t=pipeCmd.makePipe([fp.PSize,float(fp.OD),float(fp.thk),L])
-        t.PRating=fp.PRating
-        t.PSize=fp.PSize
-        t.Support = [(fp.Base,eSupport)]
-        t.MapMode = 'NormalToEdge'
-        t.MapReversed = True
-        t.AttachmentOffset=FreeCAD.Placement(FreeCAD.Vector(0,0,offset),FreeCAD.Rotation())
-        tubes.append(t.Name)
+          L-=trims[i-1]
+          offset=trims[i-1]
+        if i<len(trims): 
+          L-=trims[i]
+        tubes.append(self.makeTube(fp,i,L,offset,data).Name)
         #---Create the curve---
         if i>0:
-          e0=fp.Base.Shape.Edges[i-1]
-          alfa=degrees(e0.tangentAt(0).getAngle(e.tangentAt(0)))
-          c=pipeCmd.makeElbow([fp.PSize,float(fp.OD),float(fp.thk),alfa,R])
-          c.PRating=fp.PRating
-          c.PSize=fp.PSize
-          O='Vertex'+str(i+1)
-          c.MapReversed = False
-          c.Support = [(fp.Base,O)]
-          c.MapMode = 'Translate'
-          pipeCmd.placeTheElbow(c,e0.tangentAt(0),e.tangentAt(0))
-          curves.append(c.Name)
+          curves.append(self.makeCurve(fp,i-1,data).Name)
         fp.Tubes=tubes
         fp.Curves=curves
+      self.EdgeKeys=data['keys']
   def purge(self,fp):
     if hasattr(fp,'Tubes'):
       for name in fp.Tubes: FreeCAD.ActiveDocument.removeObject(name)
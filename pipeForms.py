@@ -7,7 +7,7 @@ __license__="LGPL 3"
 
 import FreeCAD,FreeCADGui,Part, csv
 pq=FreeCAD.Units.parseQuantity
-import frameCmd, pipeCmd
+import frameCmd, pipeCmd, catalog, labelIndex, pipeProps
 #from frameForms import prototypeForm
 from os import listdir
 from os.path import join, dirname, abspath
@@ -52,9 +52,8 @@ class protopypeForm(QDialog): #QWidget):
     self.sizeList=QListWidget()
     self.firstCol.layout().addWidget(self.sizeList)
     self.pipeDictList=[]
-    self.fileList=listdir(join(dirname(abspath(__file__)),"tables"))
     self.fillSizes()
-    self.PRatingsList=[s.lstrip(PType+"_").rstrip(".csv") for s in self.fileList if s.startswith(PType) and s.endswith('.csv')]
+    self.PRatingsList=catalog.ratings(PType)
     self.secondCol=QWidget()
     self.secondCol.setLayout(QVBoxLayout())
     self.combo=QComboBox()
@@ -84,31 +83,20 @@ class protopypeForm(QDialog): #QWidget):
       FreeCAD.__activePypeLine__=None
   def fillSizes(self):
     self.sizeList.clear()
-    for fileName in self.fileList:
-      if fileName==self.PType+'_'+self.PRating+'.csv':
-        f=open(join(dirname(abspath(__file__)),"tables",fileName),'r')
-        reader=csv.DictReader(f,delimiter=';')
-        self.pipeDictList=[DNx for DNx in reader]
-        f.close()
-        for row in self.pipeDictList:
-          s=row['PSize']
-          if row.has_key('OD'):
-            s+=" - "+row['OD']
-          if row.has_key('thk'):
-            s+="x"+row['thk']
-          self.sizeList.addItem(s)
-        break
+    self.pipeDictList=catalog.rows(self.PType,self.PRating)
+    for row in self.pipeDictList:
+      s=row['PSize']
+      if 'OD' in row:
+        s+=" - "+row['OD']
+      if 'thk' in row:
+        s+="x"+row['thk']
+      self.sizeList.addItem(s)
   def changeRating(self,item):
     self.PRating=item.text()
     self.currentRatingLab.setText('Rating: '+self.PRating)
     self.fillSizes()
   def findDN(self,DN):
-    result=None
-    for row in self.pipeDictList:
-      if row['PSize']==DN:
-        result=row
-        break
-    return result
+    return catalog.find(self.PType,self.PRating,DN)
 
 class redrawDialog(QDialog):
   def __init__(self):
@@ -148,8 +136,11 @@ class redrawDialog(QDialog):
     i=0
     for cb in self.checkBoxes:
       if cb.isChecked():
-        pl=FreeCAD.ActiveDocument.getObjectsByLabel(cb.text())[0]
-        if pl.Base:
+        pl=labelIndex.getObjectsByLabel(cb.text())[0]
+        short=pl.Base and pl.Proxy.check(pl)
+        if short:
+          FreeCAD.Console.PrintError('%s: segments %s are too short for the bend radius: not redrawn\n' %(cb.text(),short))
+        elif pl.Base:
           pl.Proxy.purge(pl)
           pl.Proxy.update(pl)
           i+=1
@@ -226,7 +217,7 @@ class insertPipeForm(protopypeForm):
           pipeCmd.moveToPyLi(self.lastPipe,self.combo.currentText())
       else:
         for v in vs: # ... one or more vertexes
-          self.lastPipe=pipeCmd.makePipe(propList,v.Point)
+          self.lastPipe=pipeCmd.makePipe(propList,*pipeCmd.snapToPort(v.Point))
         if self.combo.currentText()!='<none>':
           pipeCmd.moveToPyLi(self.lastPipe,self.combo.currentText())
     else:
@@ -545,7 +536,7 @@ class insertFlangeForm(protopypeForm):
           pipeCmd.moveToPyLi(self.lastFlange,self.combo.currentText())
       else:
         for v in vs:
-          self.lastFlange=pipeCmd.makeFlange(propList,v.Point)
+          self.lastFlange=pipeCmd.makeFlange(propList,*pipeCmd.snapToPort(v.Point))
           self.lastFlange.PRating=self.PRating
           if self.combo.currentText()!='<none>':
             pipeCmd.moveToPyLi(self.lastFlange,self.combo.currentText())
@@ -859,7 +850,7 @@ class insertCapForm(protopypeForm):
           pipeCmd.moveToPyLi(self.lastCap,self.combo.currentText())
       else:
         for v in vs:   # vertexes are selected
-          self.lastCap=pipeCmd.makeCap(propList,v.Point)
+          self.lastCap=pipeCmd.makeCap(propList,*pipeCmd.snapToPort(v.Point))
         if self.combo.currentText()!='<none>':
           pipeCmd.moveToPyLi(self.lastCap,self.combo.currentText())
     else:
@@ -929,7 +920,7 @@ class insertPypeLineForm(protopypeForm):
     self.show()
   def summary(self,pl=None):
     if self.combo.currentText()!="<new>":
-      pl=FreeCAD.ActiveDocument.getObjectsByLabel(self.combo.currentText())[0]
+      pl=labelIndex.getObjectsByLabel(self.combo.currentText())[0]
       FreeCAD.Console.PrintMessage("\n%s: %s - %s\nProfile: %.1fx%.1f\nRGB color: %.3f, %.3f, %.3f\n"%(pl.Label, pl.PSize, pl.PRating, pl.OD, pl.thk, pl.ViewObject.ShapeColor[0], pl.ViewObject.ShapeColor[1], pl.ViewObject.ShapeColor[2]))
       if pl.Base:
         FreeCAD.Console.PrintMessage('Path: %s\n'%pl.Base.Label)
@@ -938,7 +929,7 @@ class insertPypeLineForm(protopypeForm):
   def apply(self):
     d=self.pipeDictList[self.sizeList.currentRow()]
     if self.combo.currentText()!="<new>":                                           
-      pl=FreeCAD.ActiveDocument.getObjectsByLabel(self.combo.currentText())[0]
+      pl=labelIndex.getObjectsByLabel(self.combo.currentText())[0]
       pl.PSize=d["PSize"]
       pl.PRating=self.PRating
       pl.OD=float(d["OD"])
@@ -956,14 +947,14 @@ class insertPypeLineForm(protopypeForm):
       self.combo.addItem(a.Label)
     else:
       plname=self.combo.currentText()
-      plcolor=FreeCAD.activeDocument().getObjectsByLabel(plname)[0].ViewObject.ShapeColor
+      plcolor=labelIndex.getObjectsByLabel(plname)[0].ViewObject.ShapeColor
       pipeCmd.makePypeLine2(DN=d["PSize"],PRating=self.PRating,OD=float(d["OD"]),thk=float(d["thk"]), pl=plname, color=plcolor)
     FreeCAD.activeDocument().commitTransaction()
     FreeCAD.ActiveDocument.recompute()
     FreeCAD.ActiveDocument.recompute()
   def getBase(self):
     if self.combo.currentText()!="<new>":                                           
-      pl=FreeCAD.ActiveDocument.getObjectsByLabel(self.combo.currentText())[0]    
+      pl=labelIndex.getObjectsByLabel(self.combo.currentText())[0]    
       sel=FreeCADGui.Selection.getSelection()
       if sel:
         base=sel[0]
@@ -991,7 +982,7 @@ class insertPypeLineForm(protopypeForm):
     if col.isValid():
       self.color=tuple([c/255.0 for c in col.toTuple()[:3]])
       if self.combo.currentText()!="<new>":
-        pl=FreeCAD.ActiveDocument.getObjectsByLabel(self.combo.currentText())[0]
+        pl=labelIndex.getObjectsByLabel(self.combo.currentText())[0]
         pl.ViewObject.ShapeColor=self.color
         pipeCmd.updatePLColor([pl])
     self.show()
@@ -1001,12 +992,13 @@ class insertPypeLineForm(protopypeForm):
     f=qfd.getSaveFileName()[0]
     if f:
       if self.combo.currentText()!='<new>':
-        group=FreeCAD.activeDocument().getObjectsByLabel(FreeCAD.__activePypeLine__+'_pieces')[0]
-        fields=['Label','PType','PSize','Volume','Height']
+        group=labelIndex.getObjectsByLabel(FreeCAD.__activePypeLine__+'_pieces')[0]
+        fields=['Label','PType','PSize','Volume','Height','Mass']
         rows=list()
         for o in group.OutList:
           if hasattr(o,'PType') and o.PType in ['Pipe','Elbow','Flange','Clamp','Reduct','Cap']:
-            data=[o.Label,o.PType,o.PSize,o.Shape.Volume,'-']
+            props=pipeProps.properties(o)
+            data=[o.Label,o.PType,o.PSize,props['Volume'],'-',props['Mass']]
             if o.PType=='Pipe':
               data[4]=o.Height
             rows.append(dict(zip(fields,data)))
@@ -1044,7 +1036,7 @@ class insertBranchForm(protopypeForm):
     self.show()
   def summary(self,pl=None):
     if self.combo.currentText()!="<none>":
-      pl=FreeCAD.ActiveDocument.getObjectsByLabel(self.combo.currentText())[0]
+      pl=labelIndex.getObjectsByLabel(self.combo.currentText())[0]
       FreeCAD.Console.PrintMessage("\n%s: %s - %s\nProfile: %.1fx%.1f\nRGB color: %.3f, %.3f, %.3f\n"%(pl.Label, pl.PSize, pl.PRating, pl.OD, pl.thk, pl.ViewObject.ShapeColor[0], pl.ViewObject.ShapeColor[1], pl.ViewObject.ShapeColor[2]))
       if pl.Base:
         FreeCAD.Console.PrintMessage('Path: %s\n'%pl.Base.Label)
@@ -1053,7 +1045,7 @@ class insertBranchForm(protopypeForm):
   #def apply(self):
     #d=self.pipeDictList[self.sizeList.currentRow()]
     #if self.combo.currentText()!="<new>":                                           
-      #pl=FreeCAD.ActiveDocument.getObjectsByLabel(self.combo.currentText())[0]
+      #pl=labelIndex.getObjectsByLabel(self.combo.currentText())[0]
       #pl.PSize=d["PSize"]
       #pl.PRating=self.PRating
       #pl.OD=float(d["OD"])
@@ -1304,7 +1296,7 @@ class insertValveForm(protopypeForm):
         self.lastValve.ViewObject.ShapeColor=color
       else:
         for v in vs: # ... one or more vertexes
-          self.lastValve=pipeCmd.makeValve(propList,v.Point)
+          self.lastValve=pipeCmd.makeValve(propList,*pipeCmd.snapToPort(v.Point))
           self.lastValve.ViewObject.ShapeColor=color
     else:
       selex=FreeCADGui.Selection.getSelectionEx()
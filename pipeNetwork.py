@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+#(c) 2018 R. T. LGPL3
+
+__title__="Flow in pipe networks"
+__author__="oddtopus"
+__url__="github.com/oddtopus"
+__license__="LGPL 3"
+__doc__='''
+Distribution of flow and pressure in networks of pype-objects, with
+branches and loops.
+The nodes of the network are the groups of ports connected together
+(see pipePorts.portGraph): Pipes, Elbows and objects with a Kv are the
+elements between the nodes of their two ports; the other objects
+(flanges, reductions, tees...) join their ports in one node, without
+losses. The losses of elements are calculated by dpCalc.losses().
+solve() needs the pressure at one open end at least, for each part of
+the network, and optionally the flows entering the others (the open
+ends not given are closed). The system
+  dp(Q) = A*p   (each element)
+  A'*Q = q      (each node)
+is solved by Newton's method, eliminating the flows (global gradient
+algorithm) so that one sparse symmetric system is solved with SciPy at
+each iteration. If it doesn't converge, or SciPy is missing, the
+Hardy-Cross method is applied to the loops of the network, correcting
+the flows of all the loops at once.
+The friction factor is the smooth one of dpCalc.darcy(), continuous in
+the transition between laminar and turbulent flow, and the derivatives
+of the drops are the analytic ones of dpCalc.losses().
+  net=pipeNetwork.network()
+  res=net.solve({('Tube',0): 3e5, ('Tube001',1): 1e5}, rho=998, mu=1e-3)
+'''
+
+import FreeCAD, dpCalc
+import numpy as np
+
+class network(object):
+  '''
+  network(objs=None, doc=None)
+  The graph of nodes and elements of objs (default all the pype-objects
+  of doc, default the active document).
+  Attributes:
+    .elements: list of the objects with losses
+    .start, .end: arrays of the nodes of their port 0 and port 1
+    .nodes: dictionary {port: node}
+    .openEnds: list of the ports not connected
+    .data: the data of elements (see dpCalc.gather())
+  '''
+  def __init__(self,objs=None,doc=None):
+    import pipePorts
+    doc=doc or FreeCAD.ActiveDocument
+    graph=pipePorts.getGraph(doc)
+    if objs is None:
+      names=set(graph.byObject)
+    else:
+      names=set([o.Name for o in objs if o.Name in graph.byObject])
+    parent=dict([(port,port) for name in names for port in graph.byObject[name]])
+    def root(p):
+      while parent[p]!=p:
+        parent[p]=parent[parent[p]]
+        p=parent[p]
+      return p
+    def union(a,b):
+      ra,rb=root(a),root(b)
+      if ra!=rb: parent[ra]=rb
+    for port in parent:
+      for other in graph.links[port]:
+        if other in parent: union(port,other)
+    self.elements=list()
+    closed=set()
+    for name in sorted(names):
+      o=doc.getObject(name)
+      ports=graph.byObject[name]
+      if len(ports)==2 and dpCalc.hasLoss(o):
+        self.elements.append(o)
+      else:
+        for port in ports[1:]: union(ports[0],port)
+        if len(ports)==1: closed.add(ports[0]) # caps
+    roots=sorted(set([root(port) for port in parent]))
+    index=dict([(r,i) for i,r in enumerate(roots)])
+    self.nodes=dict([(port,index[root(port)]) for port in parent])
+    self.nNodes=len(roots)
+    self.start=np.array([self.nodes[(o.Name,0)] for o in self.elements],dtype=int)
+    self.end=np.array([self.nodes[(o.Name,1)] for o in self.elements],dtype=int)
+    self.openEnds=sorted([port for port in parent if port not in closed and not [p for p in graph.links[port] if p in parent]])
+    self.data=dpCalc.gather(self.elements)
+  def node(self,where):
+    'Returns the node of where, that is a port (Name, i) or a node'
+    if type(where)==tuple:
+      return self.nodes[where]
+    return int(where)
+  def components(self):
+    'Returns the array of the connected part of each node'
+    comp=np.arange(self.nNodes)
+    def root(n):
+      while comp[n]!=n:
+        comp[n]=comp[comp[n]]
+        n=comp[n]
+      return n
+    for a,b in zip(self.start,self.end):
+      ra,rb=root(a),root(b)
+      if ra!=rb: comp[ra]=rb
+    return np.array([root(n) for n in range(self.nNodes)])
+  def solve(self,pressures,flows={},rho=998.,mu=1e-3,roughness=45e-6,liquid=True,tol=1e-6,maxIter=50,method='Clamond'):
+    '''
+    solve(pressures, flows={}, rho=998., mu=1e-3, roughness=45e-6,
+      liquid=True, tol=1e-6, maxIter=50, method='Clamond')
+    Returns the dictionary of the solution:
+      'Q': flow of each element (m3/s), positive from port 0 to port 1
+      'Dp': pressure drop of each element (Pa)
+      'v': velocity of each element (m/s)
+      'p': pressure of each node (Pa; nan for parts without pressures)
+      'solver': 'Newton' or 'Hardy-Cross'; 'iterations'
+      'converged': False if the residual is still above the tolerance
+      pressures: {<port or node>: <pressure (Pa)>}
+      flows: {<port or node>: <flow entering the network (m3/s)>}
+    The other arguments are those of dpCalc.losses(); tol is relative.
+    '''
+    if not pressures:
+      raise ValueError('the pressure of one node at least is needed')
+    self.fluid=(rho,mu,roughness,liquid,method)
+    p0=dict([(self.node(k),float(v)) for k,v in pressures.items()])
+    q=np.zeros(self.nNodes)
+    for k,v in flows.items():
+      q[self.node(k)]+=float(v)
+    # only the parts with one pressure at least are solved
+    comp=self.components()
+    solved=set([comp[n] for n in p0])
+    if [n for n in np.nonzero(q)[0] if comp[n] not in solved]:
+      raise ValueError('flows entering parts of network without pressures')
+    active=np.array([comp[n] in solved for n in range(self.nNodes)],dtype=bool)
+    elems=np.nonzero(active[self.start])[0]
+    self.active=(elems,active,p0,q)
+    Q=p=None
+    try:
+      Q,p,it=self.newton(tol,maxIter)
+      solver,converged='Newton',True
+    except (ImportError,ArithmeticError):
+      pass
+    if Q is None:
+      Q,p,it,converged=self.hardyCross(tol,maxIter)
+      solver='Hardy-Cross'
+      if not converged:
+        FreeCAD.Console.PrintWarning('Pipe network: no convergence in %i iterations\n' %it)
+    flow=np.zeros(len(self.elements))
+    flow[elems]=Q
+    pressure=np.full(self.nNodes,np.nan)
+    pressure[active]=p
+    res=dpCalc.losses(self.data,flow,rho,mu,roughness,liquid,method,True)
+    return {'Q':flow,'Dp':res['Dp'],'v':res['v'],'p':pressure,'solver':solver,'iterations':it,'converged':converged}
+  def dp(self,Q,elems,data=None):
+    '''
+    dp(Q, elems, data=None)
+    Returns the arrays of pressure drops and of their derivatives for the
+    flows Q of elements elems (data: their subset of .data, if available).
+    '''
+    rho,mu,roughness,liquid,method=self.fluid
+    if data is None:
+      data=dpCalc.subset(self.data,elems)
+    res=dpCalc.losses(data,Q,rho,mu,roughness,liquid,method,True,True)
+    return res['Dp'], np.maximum(res['dDp'],1e-3) # a floor for elements without losses at Q=0
+  def newton(self,tol,maxIter):
+    '''
+    newton(tol, maxIter)
+    Returns (Q, p, iterations) of the active elements and nodes by the
+    global gradient algorithm; raises ArithmeticError if it doesn't converge.
+    '''
+    from scipy import sparse
+    from scipy.sparse.linalg import spsolve
+    elems,active,p0,q=self.active
+    nodes=np.nonzero(active)[0]
+    local=dict([(n,i) for i,n in enumerate(nodes)])
+    fixed=np.array([local[n] for n in sorted(p0)],dtype=int)
+    free=np.array([i for i in range(len(nodes)) if nodes[i] not in p0],dtype=int)
+    m,n=len(elems),len(nodes)
+    rows=np.concatenate([np.arange(m),np.arange(m)])
+    cols=np.concatenate([[local[k] for k in self.start[elems]],[local[k] for k in self.end[elems]]]).astype(int)
+    A=sparse.csr_matrix((np.concatenate([np.ones(m),-np.ones(m)]),(rows,cols)),shape=(m,n))
+    Af,A0=A[:,free],A[:,fixed]
+    pf=np.zeros(len(free))
+    pFixed=np.array([p0[k] for k in sorted(p0)])
+    qf=q[nodes][free]
+    data=self.data
+    Q=np.where(data['ID'][elems]>0,data['ID'][elems]**2*np.pi/4,1e-4)*1. # 1 m/s
+    scale=max(np.ptp(pFixed),1e3)
+    for it in range(1,maxIter+1):
+      dp,D=self.dp(Q,elems)
+      F1=dp-Af.dot(pf)-A0.dot(pFixed)
+      F2=Af.T.dot(Q)-qf
+      Dinv=sparse.diags(1/D)
+      dpf=spsolve(sparse.csc_matrix(Af.T.dot(Dinv).dot(Af)),-F2+Af.T.dot(F1/D)) if len(free) else np.zeros(0)
+      dpf=np.atleast_1d(dpf)
+      dQ=(Af.dot(dpf)-F1)/D
+      if not (np.all(np.isfinite(dpf)) and np.all(np.isfinite(dQ))):
+        raise ArithmeticError('singular network')
+      # damping of the step while the residual of pressures grows
+      r0=np.abs(F1).max()
+      step=1.
+      while step>1e-3:
+        Qn,pn=Q+step*dQ,pf+step*dpf
+        r=np.abs(self.dp(Qn,elems)[0]-Af.dot(pn)-A0.dot(pFixed)).max()
+        if r<=r0 or r<tol*scale: break
+        step/=2
+      Q,pf=Qn,pn
+      if np.abs(step*dQ).max()<=tol*max(np.abs(Q).max(),1e-9) and r<=tol*scale:
+        p=np.zeros(n)
+        p[fixed]=pFixed
+        p[free]=pf
+        return Q,p,it
+    raise ArithmeticError('no convergence in %i iterations' %maxIter)
+  def hardyCross(self,tol,maxIter):
+    '''
+    hardyCross(tol, maxIter)
+    Returns (Q, p, iterations, converged) of the active elements and nodes
+    by the Hardy-Cross method: the nodes with pressure are joined to a
+    virtual node by virtual elements, so that paths between them are
+    loops too. The corrections of all the loops are solved together at
+    each iteration, as one symmetric system (sparse with SciPy, else dense).
+    '''
+    elems,active,p0,q=self.active
+    nodes=list(np.nonzero(active)[0])
+    G=self.nNodes # the virtual node
+    # edges: (start, end, element index or None for virtual ones, drop of virtual)
+    edges=[(self.start[e],self.end[e],i,0.) for i,e in enumerate(elems)]
+    edges+=[(G,k,None,-p0[k]) for k in sorted(p0)]
+    adj=dict([(k,list()) for k in nodes+[G]])
+    for j,(a,b,i,c) in enumerate(edges):
+      adj[a].append(j); adj[b].append(j)
+    # spanning tree from G
+    parent={G:None}
+    order=[G]
+    for k in order:
+      for j in adj[k]:
+        a,b=edges[j][:2]
+        other=b if a==k else a
+        if other not in parent:
+          parent[other]=j
+          order.append(other)
+    depth={G:0}
+    for k in order[1:]:
+      a,b=edges[parent[k]][:2]
+      depth[k]=depth[a if b==k else b]+1
+    # flows of the tree that satisfy the continuity
+    Q=np.zeros(len(elems))
+    sub=dict([(k,q[k] if k!=G else 0.) for k in order])
+    for k in reversed(order[1:]):
+      j=parent[k]
+      a,b,i,c=edges[j]
+      up=a if b==k else b
+      if i is not None:
+        Q[i]=sub[k] if a==k else -sub[k]
+      sub[up]+=sub[k]
+    # fundamental loops of chords, as the matrix C (loops x elements) of signs
+    tree=set([parent[k] for k in order[1:]])
+    rows,cols,signs,fixed=list(),list(),list(),list()
+    for j in range(len(edges)):
+      if j in tree: continue
+      a,b=edges[j][:2]
+      path=[(j,1)]
+      x,y=b,a
+      tail=list()
+      while x!=y:
+        if depth[x]>=depth[y]:
+          e=parent[x]; path.append((e,1 if edges[e][0]==x else -1)); x=edges[e][0] if edges[e][1]==x else edges[e][1]
+        else:
+          e=parent[y]; tail.append((e,1 if edges[e][1]==y else -1)); y=edges[e][0] if edges[e][1]==y else edges[e][1]
+      loop=[(edges[e][2],s) for e,s in path+tail if edges[e][2] is not None]
+      if not loop: continue
+      for i,s in loop:
+        rows.append(len(fixed)); cols.append(i); signs.append(s)
+      fixed.append(sum([s*edges[e][3] for e,s in path+tail if edges[e][2] is None]))
+    fixed=np.array(fixed)
+    try:
+      from scipy import sparse
+      from scipy.sparse.linalg import spsolve
+      C=sparse.csr_matrix((signs,(rows,cols)),shape=(len(fixed),len(elems)))
+      correction=lambda D,h: np.atleast_1d(spsolve(sparse.csc_matrix(C.dot(sparse.diags(D)).dot(C.T)),h))
+    except ImportError:
+      C=np.zeros((len(fixed),len(elems)))
+      C[rows,cols]=signs
+      correction=lambda D,h: np.linalg.solve((C*D).dot(C.T),h)
+    scale=max([abs(v) for v in p0.values()]+[1e3])
+    it,worst=0,0.
+    if len(fixed):
+      dp,D=self.dp(Q,elems)
+      h=C.dot(dp)+fixed
+      worst=np.abs(h).max()
+      while worst>tol*scale and it<maxIter:
+        it+=1
+        dQ=C.T.dot(correction(D,-h))
+        if not np.all(np.isfinite(dQ)):
+          break
+        # damping of the step while the residual of loops grows
+        step=1.
+        while True:
+          dpn,Dn=self.dp(Q+step*dQ,elems)
+          hn=C.dot(dpn)+fixed
+          if np.abs(hn).max()<=worst or step<1e-3: break
+          step/=2
+        Q=Q+step*dQ
+        dp,D,h,worst=dpn,Dn,hn,np.abs(hn).max()
+    # pressures along the tree
+    dp=self.dp(Q,elems)[0] if len(elems) else np.zeros(0)
+    p={G:0.}
+    for k in order[1:]:
+      a,b,i,c=edges[parent[k]]
+      drop=c if i is None else dp[i]
+      p[k]=p[a]-drop if b==k else p[b]+drop
+    return Q,np.array([p[k] for k in nodes]),it,bool(worst<=tol*scale)
@@ -0,0 +1,309 @@
+#(c) 2018 R. T. LGPL: part of Flamingo tools w.b. for FreeCAD
+
+__title__="pypeTools ports"
+__author__="oddtopus"
+__url__="github.com/oddtopus/flamingo"
+__license__="LGPL 3"
+__doc__='''
+Connectivity of the Ports of pype-objects in the whole document.
+portGraph collects the position and direction of every port (see
+pipeCmd.portsPos() and portsDir()) and buckets them in a spatial hash
+whose cells are as large as the tolerance: two ports are connected if
+they belong to different objects, their distance is within the
+tolerance and they face each other.
+The graph is updated object by object by a document observer when
+Placement, Ports or sizes change, so queries don't rescan the document:
+  g=pipePorts.getGraph()
+  g.components(), g.openEnds(), g.mismatches()
+The graph keeps also a portTree, a KD-tree of the ports for the nearest
+and radius queries on the whole model:
+  g.nearest(point, k=1, free=True), g.within(point, r)
+'''
+
+import FreeCAD
+from math import floor, sqrt
+from heapq import heappush, heappushpop
+
+TOL=0.5 # mm
+
+def hasPorts(o):
+  'True if o is a pype-object with Ports (not a PypeLine or PypeBranch)'
+  return hasattr(o,'Ports') and hasattr(o,'Placement') and len(o.Ports)>0 and getattr(o,'PType','') not in ['PypeLine','PypeBranch']
+
+ODPORTS=['Pipe','Elbow','Reduct','Cap'] # PTypes whose OD is the one of the pipe at their ports
+
+def portSize(o,i):
+  '''
+  portSize(o,i)
+  Returns (OD, PSize) at the port i of o: the outside diameter of the pipe
+  there, None if o is not a fitting of ODPORTS (e.g. the OD of Valves is
+  the one of the body and Flanges have a bore), and the nominal size,
+  None if unknown (the minor end of Reducts).
+  '''
+  PType=getattr(o,'PType','')
+  if PType=='Reduct' and i==1:
+    return float(o.OD2), None
+  OD=float(o.OD) if PType in ODPORTS and hasattr(o,'OD') else None
+  return OD, getattr(o,'PSize','') or None
+
+class portTree(object):
+  '''
+  portTree()
+  KD-tree of the positions of ports.
+  Ports inserted or deleted after the tree was built are kept aside
+  (.pending, .stale) and the tree is built again at the first query
+  after they have become too many.
+  '''
+  def __init__(self):
+    self.points=dict() # {port: position}
+    self.root=None
+    self.pending=set() # ports not in the tree
+    self.stale=set()   # ports in the tree deleted or moved
+  def insert(self,port,pos):
+    self.points[port]=tuple(pos)
+    self.pending.add(port)
+  def delete(self,port):
+    if self.points.pop(port,None) is not None:
+      if port in self.pending:
+        self.pending.discard(port)
+      else:
+        self.stale.add(port)
+  def build(self):
+    'Builds the tree with all the points'
+    def node(items,axis):
+      if not items:
+        return None
+      items.sort(key=lambda item: item[0][axis])
+      m=len(items)//2
+      return (items[m][0],items[m][1],axis,node(items[:m],(axis+1)%3),node(items[m+1:],(axis+1)%3))
+    self.root=node([(pos,port) for port,pos in self.points.items()],0)
+    self.pending=set()
+    self.stale=set()
+  def check(self):
+    'Builds the tree again if too many changes are pending'
+    if len(self.pending)+len(self.stale)>32+len(self.points)//16:
+      self.build()
+  def nearest(self,point,k=1,accept=None):
+    '''
+    nearest(point, k=1, accept=None)
+    Returns the list of the k (distance, port) nearest to point, sorted.
+      accept: an optional function that returns False for the ports to skip
+    '''
+    self.check()
+    point=tuple(point)
+    heap=list() # (-distance**2, port): the farthest on top
+    def visit(pos,port):
+      if accept and not accept(port):
+        return
+      d2=sum([(point[i]-pos[i])**2 for i in range(3)])
+      if len(heap)<k:
+        heappush(heap,(-d2,port))
+      elif d2<-heap[0][0]:
+        heappushpop(heap,(-d2,port))
+    def search(node):
+      if not node:
+        return
+      pos,port,axis,left,right=node
+      if port not in self.stale:
+        visit(pos,port)
+      diff=point[axis]-pos[axis]
+      near,far=(left,right) if diff<0 else (right,left)
+      search(near)
+      if len(heap)<k or diff*diff<-heap[0][0]:
+        search(far)
+    search(self.root)
+    for port in self.pending:
+      visit(self.points[port],port)
+    return sorted([(sqrt(-d2),port) for d2,port in heap])
+  def within(self,point,r,accept=None):
+    '''
+    within(point, r, accept=None)
+    Returns the list of (distance, port) within r from point, sorted.
+    '''
+    self.check()
+    point=tuple(point)
+    r2=r*r
+    found=list()
+    def visit(pos,port):
+      d2=sum([(point[i]-pos[i])**2 for i in range(3)])
+      if d2<=r2 and not (accept and not accept(port)):
+        found.append((sqrt(d2),port))
+    def search(node):
+      if not node:
+        return
+      pos,port,axis,left,right=node
+      if port not in self.stale:
+        visit(pos,port)
+      diff=point[axis]-pos[axis]
+      if diff<=r: search(left)
+      if diff>=-r: search(right)
+    search(self.root)
+    for port in self.pending:
+      visit(self.points[port],port)
+    return sorted(found)
+
+class portGraph(object):
+  '''
+  portGraph(doc=None, tol=TOL)
+  Graph of the connections among the ports of the pype-objects of doc
+  (default the active document).
+  Ports are identified by (<object Name>, <port number>).
+  Attributes:
+    .ports: {port: (position, direction, (OD, PSize))}
+    .links: {port: set(<connected ports>)}
+    .tree: the portTree of all ports
+  '''
+  def __init__(self,doc=None,tol=TOL):
+    self.doc=doc or FreeCAD.ActiveDocument
+    self.tol=float(tol)
+    self.rebuild()
+  def rebuild(self):
+    'Collects again all the ports of the document'
+    self.ports=dict()
+    self.links=dict()
+    self.cells=dict()
+    self.byObject=dict()
+    self.tree=portTree()
+    for o in self.doc.Objects:
+      self.add(o)
+  def cell(self,pos):
+    return tuple([int(floor(x/self.tol)) for x in pos])
+  def neighbours(self,pos):
+    'Yields the ports in the cells around pos'
+    cx,cy,cz=self.cell(pos)
+    for i in (-1,0,1):
+      for j in (-1,0,1):
+        for k in (-1,0,1):
+          for port in self.cells.get((cx+i,cy+j,cz+k),()):
+            yield port
+  def add(self,o):
+    'Adds the ports of object o and connects them'
+    import pipeCmd
+    if not hasPorts(o):
+      return
+    positions=pipeCmd.portsPos(o)
+    directions=pipeCmd.portsDir(o)
+    keys=list()
+    for i in range(min(len(positions),len(directions))):
+      port=(o.Name,i)
+      pos,Z=tuple(positions[i]),tuple(directions[i])
+      self.ports[port]=(pos,Z,portSize(o,i))
+      self.links[port]=set()
+      for other in self.neighbours(pos):
+        if other[0]!=o.Name and self.isLinked(port,other):
+          self.links[port].add(other)
+          self.links[other].add(port)
+      self.cells.setdefault(self.cell(pos),set()).add(port)
+      self.tree.insert(port,pos)
+      keys.append(port)
+    self.byObject[o.Name]=keys
+  def remove(self,name):
+    'Removes the ports of the object with name'
+    for port in self.byObject.pop(name,[]):
+      pos=self.ports.pop(port)[0]
+      self.tree.delete(port)
+      for other in self.links.pop(port):
+        self.links[other].discard(port)
+      cell=self.cells.get(self.cell(pos))
+      if cell:
+        cell.discard(port)
+        if not cell: del self.cells[self.cell(pos)]
+  def update(self,o):
+    'Updates the ports of object o after it has been moved or modified'
+    self.remove(o.Name)
+    self.add(o)
+  def isLinked(self,p1,p2):
+    'True if ports p1 and p2 are within tolerance and face each other'
+    (a,za,sa),(b,zb,sb)=self.ports[p1],self.ports[p2]
+    d2=sum([(a[i]-b[i])**2 for i in range(3)])
+    return d2<=self.tol**2 and sum([za[i]*zb[i] for i in range(3)])<0
+  def components(self):
+    'Returns the list of sets of Names of connected objects'
+    parent=dict([(name,name) for name in self.byObject])
+    def root(n):
+      while parent[n]!=n:
+        parent[n]=parent[parent[n]]
+        n=parent[n]
+      return n
+    for port,others in self.links.items():
+      for other in others:
+        r1,r2=root(port[0]),root(other[0])
+        if r1!=r2: parent[r1]=r2
+    groups=dict()
+    for name in parent:
+      groups.setdefault(root(name),set()).add(name)
+    return list(groups.values())
+  def openEnds(self):
+    'Returns the list of ports not connected to anything'
+    return sorted([port for port,others in self.links.items() if not others])
+  def mismatches(self):
+    '''
+    Returns the list of pairs of connected ports with different sizes:
+    the ODs (within tol) if both are known, else the PSizes, if both
+    are known (see portSize()).
+    '''
+    pairs=set()
+    for port,others in self.links.items():
+      for other in others:
+        (OD1,DN1),(OD2,DN2)=self.ports[port][2],self.ports[other][2]
+        if OD1 is not None and OD2 is not None:
+          differ=abs(OD1-OD2)>self.tol
+        else:
+          differ=bool(DN1 and DN2 and DN1!=DN2)
+        if differ: pairs.add(tuple(sorted([port,other])))
+    return sorted(pairs)
+  def accept(self,free,exclude):
+    'Returns the filter of ports for the queries of tree'
+    if not (free or exclude):
+      return None
+    return lambda port: not (free and self.links[port]) and port[0] not in exclude
+  def nearest(self,point,k=1,free=True,exclude=[]):
+    '''
+    nearest(point, k=1, free=True, exclude=[])
+    Returns the list of the k (distance, port) nearest to point.
+      free: only the ports not connected
+      exclude: Names of objects whose ports are skipped
+    '''
+    return self.tree.nearest(point,k,self.accept(free,exclude))
+  def within(self,point,r,free=True,exclude=[]):
+    '''
+    within(point, r, free=True, exclude=[])
+    Returns the list of (distance, port) within r from point.
+    '''
+    return self.tree.within(point,r,self.accept(free,exclude))
+  def connected(self,o):
+    'Returns the set of Names of objects connected to o'
+    return set([other[0] for port in self.byObject.get(o.Name,[]) for other in self.links[port]])
+
+class portObserver(object):
+  'Document observer that keeps the graphs of getGraph() up to date'
+  props=['Placement','Ports','OD','OD2','PSize']
+  def slotChangedObject(self,obj,prop):
+    if prop in self.props:
+      g=graphs.get(obj.Document.Name)
+      if g and (obj.Name in g.byObject or hasPorts(obj)):
+        g.update(obj)
+  def slotDeletedObject(self,obj):
+    g=graphs.get(obj.Document.Name)
+    if g: g.remove(obj.Name)
+  def slotDeletedDocument(self,doc):
+    graphs.pop(doc.Name,None)
+
+graphs=dict()
+observer=None
+
+def getGraph(doc=None,tol=TOL):
+  '''
+  getGraph(doc=None, tol=TOL)
+  Returns the portGraph of doc (default the active document), built
+  at the first request and then kept up to date by a document observer.
+  '''
+  global observer
+  doc=doc or FreeCAD.ActiveDocument
+  g=graphs.get(doc.Name)
+  if not g or g.doc!=doc or g.tol!=float(tol):
+    g=graphs[doc.Name]=portGraph(doc,tol)
+  if not observer and hasattr(FreeCAD,'addDocumentObserver'):
+    observer=portObserver()
+    FreeCAD.addDocumentObserver(observer)
+  return g
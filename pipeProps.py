@@ -0,0 +1,146 @@
+#(c) 2018 R. T. LGPL: part of Flamingo tools w.b. for FreeCAD
+
+__title__="pypeTools properties"
+__author__="oddtopus"
+__url__="github.com/oddtopus/flamingo"
+__license__="LGPL 3"
+__doc__='''
+Volume, surface area, length of center-line and mass of pype-objects,
+calculated with their parameters instead of the mass properties of
+shapes: the geometry is the same built in pipeShapes (full detail).
+All the functions <PType>Props() return the tuple (volume, area, length)
+in mm3, mm2 and mm; properties(o) returns a dictionary with also the mass
+(kg), using the density of the material in tables/Material_density.csv.
+The material is the property Material of the object, if any, or the one
+set in preferences (Material, default "Carbon steel").
+'''
+
+import FreeCAD
+from math import pi, sqrt, radians
+
+def pipeProps(OD,thk,H):
+  'Tube: annulus extruded by H'
+  R=float(OD)/2; r=max(R-float(thk),0); H=float(H)
+  A=pi*(R**2-r**2)
+  return A*H, 2*pi*(R+r)*H+2*A, H
+
+def elbowProps(OD,thk,BA,BR):
+  'Elbow: sector of torus (Pappus-Guldinus)'
+  R=float(OD)/2; r=max(R-float(thk),0); L=float(BR)*radians(float(BA))
+  A=pi*(R**2-r**2)
+  return A*L, 2*pi*(R+r)*L+2*A, L
+
+def frustum(R1,R2,H):
+  'Returns (volume, lateral area) of a frustum of cone'
+  return pi*H/3*(R1**2+R1*R2+R2**2), pi*(R1+R2)*sqrt(H**2+(R1-R2)**2)
+
+def reductProps(OD,OD2,thk,thk2,H):
+  '''
+  Reduction: frustum of cone minus the bore. The volume of the eccentric
+  loft is the same; its lateral area is taken as the concentric one's.
+  '''
+  R1,R2,H=float(OD)/2,float(OD2)/2,float(H)
+  r1,r2=max(R1-float(thk),0),max(R2-float(thk2),0)
+  V,S=frustum(R1,R2,H)
+  v,s=frustum(r1,r2,H)
+  return V-v, S+s+pi*(R1**2-r1**2)+pi*(R2**2-r2**2), H
+
+def flangeProps(D,d,f,t,n):
+  'Flange: disk minus the bore and the bolt holes'
+  D,d,f,t,n=float(D),float(d),float(f),float(t),int(n)
+  A=pi/4*(D**2-d**2-n*f**2)
+  return A*t, 2*A+pi*(D+d+n*f)*t, t
+
+def dome(R,Rs,z0):
+  '''
+  Returns (volume, area, height) of the solid inside both the cylinder of
+  radius R over z=0 and the sphere of radius Rs centered in (0,0,z0).
+  '''
+  zi=z0+sqrt(Rs**2-R**2) # where the sphere meets the cylinder
+  h=z0+Rs-zi             # height of the spherical cap
+  return pi*R**2*zi+pi*h**2*(3*Rs-h)/3, 2*pi*R*zi+2*pi*Rs*h, zi+h
+
+def capProps(OD,thk):
+  'Cap: spherical dome on a short cylinder, as pipeShapes.capShape() without its fillets'
+  D,s=float(OD),float(thk)
+  z0=-(0.55*D-6*s)
+  V,S,H=dome(D/2,0.8*D,z0)
+  v,s2,h=dome(D/2-s,0.8*D-s,z0)
+  return V-v, S+s2+pi*((D/2)**2-(D/2-s)**2), H
+
+def revolution(profile,H,n=64):
+  '''
+  Returns (volume, lateral area) of the solid of revolution of radius
+  profile(z), 0<=z<=H, as the sum of n frustums of cone.
+  '''
+  dz=float(H)/n
+  V=S=0.
+  for i in range(n):
+    v,s=frustum(profile(i*dz),profile((i+1)*dz),dz)
+    V+=v; S+=s
+  return V, S
+
+def valveProps(OD,H,ball=True):
+  'Valve: two cones and the optional sphere of the body'
+  R,H=float(OD)/2,float(H)
+  rs=min(H*0.45,R) if ball else 0
+  def profile(z):
+    x=abs(z-H/2)
+    return max(R*2/5+(R-R*2/5)*x/(H/2), sqrt(max(rs**2-x**2,0)))
+  V,S=revolution(profile,H)
+  return V, S+2*pi*R**2, H
+
+def uboltProps(C,H,d):
+  'U-bolt: rod swept along a half circle and two straight legs'
+  C,H,d=float(C),float(H),float(d)
+  L=pi*C/2+2*(H-C/2)
+  return pi*d**2/4*L, pi*d*L+pi*d**2/2, L
+
+def geometry(o):
+  '''
+  geometry(o)
+  Returns (volume, area, length) of the pype-object o, or None if
+  its PType is not known.
+  '''
+  PType=getattr(o,'PType','')
+  if PType=='Pipe':
+    return pipeProps(o.OD,o.thk,o.Height)
+  if PType=='Elbow':
+    return elbowProps(o.OD,o.thk,o.BendAngle,o.BendRadius)
+  if PType=='Reduct':
+    return reductProps(o.OD,o.OD2,o.thk,o.thk2,o.Height)
+  if PType=='Flange':
+    return flangeProps(o.D,o.d,o.f,o.t,o.n)
+  if PType=='Cap':
+    return capProps(o.OD,o.thk)
+  if PType=='Valve':
+    return valveProps(o.OD,o.Height,bool(o.PRating.find('ball')+1 or o.PRating.find('globe')+1))
+  if PType=='Clamp':
+    return uboltProps(o.C,o.H,o.d)
+  return None
+
+def densities():
+  'Returns the dictionary {<material>: <density kg/m3>} of tables/Material_density.csv'
+  import catalog
+  return dict([(row['Material'],row['density']) for row in catalog.rows('Material','density',numeric=True)])
+
+def material(o=None):
+  'Returns the material of o or, if not defined, the default one in preferences'
+  if o and getattr(o,'Material',''):
+    return o.Material
+  return FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/flamingo").GetString('Material','Carbon steel')
+
+def properties(o,density=None):
+  '''
+  properties(o, density=None)
+  Returns the dictionary {'Volume','Area','Length','Mass'} of the pype-object o.
+  Objects of unknown PType use the mass properties of their shape.
+    density (float): kg/m3; default the one of the material of o
+  '''
+  g=geometry(o)
+  if not g:
+    g=(o.Shape.Volume,o.Shape.Area,0.)
+  if density is None:
+    density=densities().get(material(o),0.)
+  V,S,L=g
+  return {'Volume':V,'Area':S,'Length':L,'Mass':V*1e-9*density}
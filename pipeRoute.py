@@ -0,0 +1,116 @@
+#(c) 2018 R. T. LGPL: part of Flamingo tools w.b. for FreeCAD
+
+__title__="pypeTools route solver"
+__author__="oddtopus"
+__url__="github.com/oddtopus/flamingo"
+__license__="LGPL 3"
+__doc__='''
+Vectorized solver of pipe routes.
+Given the vertexes of a polyline, solveRoute() calculates with NumPy, in
+one pass for all the segments, the directions, the bend angles, the
+trimming of the tubes at the elbows, the position and length of tubes
+and the placement of elbows.
+The elbows are oriented as pipeCmd.placeTheElbow() does: port 0 toward
+the incoming segment and port 1 toward the outgoing one.
+'''
+
+import numpy as np
+
+ANGLE_TOL=1e-6 # deg: smaller deviations are straight joints
+
+def polyline(edges, tol=1e-6):
+  '''
+  polyline(edges, tol=1e-6)
+  Returns the array of the N+1 vertexes of the N edges if they are
+  straight and each starts where the previous ends, else None.
+  '''
+  points=list()
+  for e in edges:
+    if type(e.Curve).__name__ not in ['Line','LineSegment']:
+      return None
+    p0,p1=e.valueAt(e.FirstParameter),e.valueAt(e.LastParameter)
+    if not points:
+      points.append(tuple(p0))
+    elif np.linalg.norm(np.array(tuple(p0))-points[-1])>tol:
+      return None
+    points.append(tuple(p1))
+  return np.array(points,dtype=float)
+
+def solveRoute(points, BR):
+  '''
+  solveRoute(points, BR)
+  Returns a dictionary of arrays describing the pipes and elbows along
+  the polyline through points:
+    points: sequence of N+1 vertexes (x,y,z)
+    BR: bend radius (float or sequence of N-1 floats)
+  Keys of the result:
+    'directions' (N,3): unit vectors of segments
+    'starts' (N,3): start points of the trimmed tubes
+    'lengths' (N,): lengths of the trimmed tubes
+    'angles' (N-1,): bend angles at the inner vertexes (deg)
+    'bends' (N-1,): True where an elbow is needed
+    'tangents' (N-1,): trimming of the tubes at each inner vertex
+    'elbowPos' (N-1,3): position of elbows (the inner vertexes)
+    'elbowRot' (N-1,4): rotation of elbows as quaternions (x,y,z,w)
+  '''
+  P=np.asarray(points,dtype=float)
+  if P.ndim!=2 or P.shape[0]<2 or P.shape[1]!=3:
+    raise ValueError('at least 2 points (x,y,z) are needed')
+  seg=P[1:]-P[:-1]
+  L=np.linalg.norm(seg,axis=1)
+  if np.any(L==0):
+    raise ValueError('the route has coincident vertexes')
+  d=seg/L[:,None]
+  d1,d2=d[:-1],d[1:]
+  ang=np.degrees(np.arccos(np.clip((d1*d2).sum(axis=1),-1,1)))
+  bends=(ang>ANGLE_TOL)&(ang<180-ANGLE_TOL)
+  BR=np.broadcast_to(np.asarray(BR,dtype=float),ang.shape)
+  tang=np.where(bends,BR*np.tan(np.radians(np.where(bends,ang,0))/2),0.)
+  trimStart=np.concatenate([[0.],tang])
+  trimEnd=np.concatenate([tang,[0.]])
+  # frame of elbows: bisect of the outer directions of ports, normal, and their cross
+  n=np.cross(d1,d2)
+  b=d2-d1
+  n/=np.where(bends,np.linalg.norm(n,axis=1),1.)[:,None]
+  b/=np.where(bends,np.linalg.norm(b,axis=1),1.)[:,None]
+  W=np.stack([b,np.cross(n,b),n],axis=2)
+  s=np.sqrt(.5)
+  C=np.array([[s,-s,0],[s,s,0],[0,0,1.]]) # the same frame of the elbow in its own coordinates
+  R=np.matmul(W,C.T)
+  return {'directions':d,
+    'starts':P[:-1]+d*trimStart[:,None],
+    'lengths':L-trimStart-trimEnd,
+    'angles':ang,
+    'bends':bends,
+    'tangents':tang,
+    'elbowPos':P[1:-1],
+    'elbowRot':quaternions(R)}
+
+def quaternions(R):
+  '''
+  quaternions(R)
+  Returns the array (M,4) of quaternions (x,y,z,w) of the rotation
+  matrixes R (M,3,3).
+  '''
+  R=np.asarray(R,dtype=float).reshape(-1,3,3)
+  q=np.empty((len(R),4))
+  tr=R[:,0,0]+R[:,1,1]+R[:,2,2]
+  diag=np.stack([R[:,0,0],R[:,1,1],R[:,2,2]],axis=1)
+  k=np.argmax(diag,axis=1)
+  # w is the largest component
+  i=tr>0
+  S=np.sqrt(np.maximum(tr[i]+1,0))*2
+  q[i]=np.stack([(R[i,2,1]-R[i,1,2])/S,(R[i,0,2]-R[i,2,0])/S,(R[i,1,0]-R[i,0,1])/S,S/4],axis=1)
+  # x is the largest component
+  i=(tr<=0)&(k==0)
+  S=np.sqrt(np.maximum(1+R[i,0,0]-R[i,1,1]-R[i,2,2],0))*2
+  q[i]=np.stack([S/4,(R[i,0,1]+R[i,1,0])/S,(R[i,0,2]+R[i,2,0])/S,(R[i,2,1]-R[i,1,2])/S],axis=1)
+  # y is the largest component
+  i=(tr<=0)&(k==1)
+  S=np.sqrt(np.maximum(1+R[i,1,1]-R[i,0,0]-R[i,2,2],0))*2
+  q[i]=np.stack([(R[i,0,1]+R[i,1,0])/S,S/4,(R[i,1,2]+R[i,2,1])/S,(R[i,0,2]-R[i,2,0])/S],axis=1)
+  # z is the largest component
+  i=(tr<=0)&(k==2)
+  S=np.sqrt(np.maximum(1+R[i,2,2]-R[i,0,0]-R[i,1,1],0))*2
+  q[i]=np.stack([(R[i,0,2]+R[i,2,0])/S,(R[i,1,2]+R[i,2,1])/S,S/4,(R[i,1,0]-R[i,0,1])/S],axis=1)
+  return q
@@ -0,0 +1,553 @@
+#(c) 2018 R. T. LGPL: part of Flamingo tools w.b. for FreeCAD
+
+__title__="pypeTools shapes"
+__author__="oddtopus"
+__url__="github.com/oddtopus/flamingo"
+__license__="LGPL 3"
+__doc__='''
+Geometry of the pipeFeatures and a process-wide cache of their shapes.
+Objects with the same defining parameters share the same solid: this is
+built once and then copied to each object, that positions it with its own
+Placement.
+The memory budget of the cache is read in the preferences
+("User parameter:BaseApp/Preferences/Mod/flamingo", ShapeCacheMB).
+Shapes are also saved as BREP files in the user data directory, so
+they survive across sessions (DiskCache, DiskCacheMB): change 
+GEOMETRY_VERSION whenever the geometry built here is modified.
+With proxy=True the functions return a simplified geometry, much lighter
+to build and to display, used by the objects whose LOD is 'Proxy'.
+buildMany() builds many shapes in a pool of processes (BuildProcesses),
+only where FreeCAD runs without GUI (e.g. FreeCADCmd scripts).
+'''
+
+import FreeCAD, Part, os
+from collections import OrderedDict
+
+GEOMETRY_VERSION='1'
+
+def getParams():
+  'Returns the parameter group of flamingo in the user preferences'
+  return FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/flamingo")
+
+################ CACHE ###########################
+
+def paramsKey(*params):
+  'Returns the tuple of params where floats are rounded to get rid of numerical noise'
+  return tuple([round(float(p),6) if type(p) in [int,float] or hasattr(p,'Value') else p for p in params])
+
+def fingerprint(name,*params):
+  '''
+  fingerprint(name,*params)
+  Returns a digest of the shape name built with params: it changes only
+  when the geometry changes (including GEOMETRY_VERSION).
+  '''
+  from hashlib import sha1
+  return sha1(repr((name,paramsKey(*params),GEOMETRY_VERSION)).encode('utf-8')).hexdigest()
+
+class shapeCache(object):
+  '''
+  shapeCache(name, budget=None)
+  A LRU cache of shapes keyed on the tuple of their defining parameters.
+    name (string): the name of the cache (usually the PType)
+    budget (int): max size in MB; if None it's read in preferences
+  Counters .hits and .misses are updated at every call of get().
+  '''
+  def __init__(self,name,budget=None):
+    self.name=name
+    self.budget=budget
+    self.shapes=OrderedDict()
+    self.sizes=dict()
+    self.size=0
+    self.hits=self.misses=0
+  def key(self,*params):
+    'Returns the key for params: floats are rounded to get rid of numerical noise'
+    return paramsKey(*params)
+  def get(self,key,builder):
+    '''
+    get(key,builder)
+    Returns a copy of the shape stored with key.
+    If it's missing, it's built with builder() and stored.
+    '''
+    if key in self.shapes:
+      self.hits+=1
+      shape=self.shapes.pop(key)
+      self.shapes[key]=shape # most recently used at the end
+    else:
+      self.misses+=1
+      size=None
+      if preset is not None: # built by a worker of buildMany()
+        shape=preset
+        size=disk.save(self.name,key,shape)
+      else:
+        shape=disk.load(self.name,key)
+        if shape==None:
+          shape=builder()
+          size=disk.save(self.name,key,shape)
+      self.store(key,shape,size)
+    return shape.copy()
+  def store(self,key,shape,size=None):
+    '''
+    store(key,shape,size=None)
+    Adds shape to the cache and evicts the least recently used ones if it 
+    exceeds the budget.
+      size (int): the bytes of its BREP, if known; else it's estimated
+    '''
+    if key in self.shapes:
+      self.discard(key)
+    self.shapes[key]=shape
+    self.sizes[key]=size or shapeSize(shape)
+    self.size+=self.sizes[key]
+    budget=self.budget
+    if budget==None:
+      budget=getParams().GetInt('ShapeCacheMB',64)
+    while self.size>budget*1048576 and len(self.shapes)>1:
+      self.discard(next(iter(self.shapes)))
+  def discard(self,key):
+    'Removes the shape with key from the cache'
+    self.shapes.pop(key)
+    self.size-=self.sizes.pop(key)
+  def clear(self):
+    'Empties the cache and resets the counters'
+    self.shapes.clear()
+    self.sizes.clear()
+    self.size=0
+    self.hits=self.misses=0
+  def stats(self):
+    'Returns a dictionary with the counters of the cache'
+    return {'name':self.name,'shapes':len(self.shapes),'size':self.size,'hits':self.hits,'misses':self.misses}
+
+def shapeSize(shape):
+  'Returns the estimated size (bytes) of the BREP of shape, from the nr. of its faces and edges, without exporting it'
+  return 1024*len(shape.Faces)+256*len(shape.Edges)
+
+class diskCache(object):
+  '''
+  diskCache(path=None)
+  A content-addressed store of BREP files: the name of each file is the 
+  hash of the PType, of the key of parameters and of GEOMETRY_VERSION.
+    path (string): the directory; default = <user data dir>/flamingo/shapes
+  The size is bounded to DiskCacheMB (preferences, default 256): the least 
+  recently used files are removed first.
+  '''
+  def __init__(self,path=None):
+    if not path:
+      path=os.path.join(FreeCAD.getUserAppDataDir(),'flamingo','shapes')
+    self.path=path
+    self.size=None
+    self.hits=self.misses=0
+  def enabled(self):
+    return getParams().GetBool('DiskCache',True)
+  def fileName(self,name,key):
+    'Returns the path of the file for the shape name+key'
+    from hashlib import sha1
+    h=sha1(repr((name,key,GEOMETRY_VERSION)).encode('utf-8')).hexdigest()
+    return os.path.join(self.path,h+'.brep')
+  def files(self):
+    'Returns the list of (path, size, time of last use) of the files in the cache'
+    if not os.path.isdir(self.path):
+      return []
+    files=list()
+    for f in os.listdir(self.path):
+      if f.endswith('.brep'):
+        p=os.path.join(self.path,f)
+        st=os.stat(p)
+        files.append((p,st.st_size,st.st_mtime))
+    return files
+  def load(self,name,key):
+    '''
+    load(name,key)
+    Returns the shape stored for name+key or None.
+    '''
+    if not self.enabled():
+      return None
+    fn=self.fileName(name,key)
+    if os.path.exists(fn):
+      try:
+        shape=Part.Shape()
+        shape.read(fn)
+        os.utime(fn,None) # mark as recently used
+        self.hits+=1
+        return shape
+      except:
+        FreeCAD.Console.PrintWarning('Shape cache: %s not readable\n' %fn)
+    self.misses+=1
+    return None
+  def save(self,name,key,shape):
+    '''
+    save(name,key,shape)
+    Writes shape for name+key and evicts the oldest files if the size 
+    exceeds the budget.
+    Returns the size of the file or None if it's not written, as in the
+    workers of buildMany(), whose shapes are saved by the main process.
+    '''
+    if not self.enabled() or worker:
+      return None
+    try:
+      if not os.path.isdir(self.path):
+        os.makedirs(self.path)
+      fn=self.fileName(name,key)
+      tmp=fn+'.%i.tmp' %os.getpid()
+      shape.exportBrep(tmp)
+      old=0
+      if os.path.exists(fn):
+        old=os.path.getsize(fn)
+        os.remove(fn)
+      os.rename(tmp,fn)
+      written=os.path.getsize(fn)
+    except:
+      FreeCAD.Console.PrintWarning('Shape cache: unable to write in %s\n' %self.path)
+      return None
+    if self.size==None:
+      self.size=sum([f[1] for f in self.files()])
+    else:
+      self.size+=written-old
+    budget=getParams().GetInt('DiskCacheMB',256)*1048576
+    if self.size>budget:
+      files=sorted(self.files(),key=lambda f: f[2])
+      self.size=sum([f[1] for f in files])
+      while files and self.size>budget:
+        p,size,t=files.pop(0)
+        os.remove(p)
+        self.size-=size
+    return written
+  def clear(self):
+    'Deletes all the files of the cache'
+    for f in self.files():
+      os.remove(f[0])
+    self.size=0
+    self.hits=self.misses=0
+  def stats(self):
+    'Returns a dictionary with the counters of the cache'
+    files=self.files()
+    self.size=sum([f[1] for f in files])
+    return {'path':self.path,'files':len(files),'size':self.size,'hits':self.hits,'misses':self.misses}
+
+disk=diskCache()
+
+caches=dict()
+
+def getCache(name):
+  '''
+  getCache(name)
+  Returns the shapeCache with name, created on demand.
+  '''
+  if name not in caches:
+    caches[name]=shapeCache(name)
+  return caches[name]
+
+def cacheStats():
+  'Prints and returns the counters of all the caches, the one on disk as last'
+  stats=[c.stats() for c in caches.values()]
+  for s in stats:
+    FreeCAD.Console.PrintMessage('%s: %i shapes, %.1f kB, %i hits, %i misses\n' %(s['name'],s['shapes'],s['size']/1024.0,s['hits'],s['misses']))
+  s=disk.stats()
+  FreeCAD.Console.PrintMessage('%s: %i files, %.1f kB, %i hits, %i misses\n' %(s['path'],s['files'],s['size']/1024.0,s['hits'],s['misses']))
+  stats.append(s)
+  return stats
+
+def clearCaches(onDisk=False):
+  '''
+  clearCaches(onDisk=False)
+  Empties all the caches in memory and, if onDisk, also the one on disk.
+  '''
+  for c in caches.values(): c.clear()
+  if onDisk: disk.clear()
+
+################ SHAPES ###########################
+
+def pipeShape(OD,thk,H,proxy=False):
+  '''
+  pipeShape(OD,thk,H,proxy=False)
+  Returns the shape of one tube.
+    OD (float): outside diameter
+    thk (float): wall thickness
+    H (float): length
+    proxy (bool): if True, returns a solid cylinder
+  '''
+  OD,thk,H,proxy=float(OD),float(thk),float(H),bool(proxy)
+  def build():
+    if OD-2*thk>0 and not proxy:
+      return Part.makeCylinder(OD/2,H).cut(Part.makeCylinder(OD/2-thk,H))
+    else:
+      return Part.makeCylinder(OD/2,H)
+  cache=getCache('Pipe')
+  return cache.get(cache.key(OD,thk,H,proxy),build)
+
+def quantizeAngle(BA):
+  '''
+  quantizeAngle(BA)
+  Returns the bend angle BA rounded to the tolerance set in preferences
+  (ElbowAngleTol, degrees; default 0.01): elbows whose angles differ less 
+  than that share the same shape.
+  '''
+  tol=getParams().GetFloat('ElbowAngleTol',0.01)
+  if tol>0:
+    return round(float(BA)/tol)*tol
+  return float(BA)
+
+def elbowGeometry(BA,BR):
+  '''
+  elbowGeometry(BA,BR)
+  Returns (C, [port0, port1], [dir0, dir1]) of one elbow in its canonical 
+  frame: the center of bend C, the position of ports and the tangents
+  of the center-line at the ports, both oriented along the flow.
+  The center-line is an arc in the XY plane whose bisect is the direction 
+  (1,1,0) and Placement.Base is the intersection of the tangents at the ends.
+    BA (float): bend angle (deg)
+    BR (float): bend radius
+  '''
+  from math import pi, cos, sin, sqrt, radians
+  BA,BR=float(BA),float(BR)
+  d=(BR*sqrt(2)-BR/cos(BA/180*pi/2))
+  C=FreeCAD.Vector(BR-d*cos(pi/4),BR-d*cos(pi/4),0)
+  ports=list()
+  dirs=list()
+  for a in [radians(225-BA/2),radians(225+BA/2)]:
+    ports.append(C+FreeCAD.Vector(BR*cos(a),BR*sin(a),0))
+    dirs.append(FreeCAD.Vector(-sin(a),cos(a),0))
+  return C, ports, dirs
+
+def elbowShape(OD,thk,BA,BR,proxy=False):
+  '''
+  elbowShape(OD,thk,BA,BR,proxy=False)
+  Returns the shape of one elbow in its canonical frame (see elbowGeometry()).
+  The section of the elbow is revolved around the axis of bend, that
+  is much faster than sweeping and thickening it.
+    OD (float): outside diameter
+    thk (float): wall thickness
+    BA (float): bend angle (deg), quantized with quantizeAngle()
+    BR (float): bend radius
+    proxy (bool): if True, returns solid cylinders along a polyline
+      that approximates the center-line (one each 30 deg)
+  '''
+  OD,thk,BA,BR,proxy=float(OD),float(thk),quantizeAngle(BA),float(BR),bool(proxy)
+  def build():
+    C,ports,dirs=elbowGeometry(BA,BR)
+    if proxy:
+      from math import cos, sin, radians
+      n=int(BA/30)+1
+      points=[C+FreeCAD.Vector(BR*cos(a),BR*sin(a),0) for a in [radians(225-BA/2+BA*i/n) for i in range(n+1)]]
+      return Part.makeCompound([Part.makeCylinder(OD/2,(points[i+1]-points[i]).Length,points[i],points[i+1]-points[i]) for i in range(n)])
+    section=Part.Face(Part.Wire(Part.makeCircle(OD/2,ports[0],dirs[0])))
+    if OD-2*thk>0:
+      section=section.cut(Part.Face(Part.Wire(Part.makeCircle(OD/2-thk,ports[0],dirs[0]))))
+    return section.revolve(C,FreeCAD.Vector(0,0,1),BA)
+  cache=getCache('Elbow')
+  return cache.get(cache.key(OD,thk,BA,BR,proxy),build)
+
+def flangeShape(D,d,df,f,t,n,proxy=False):
+  '''
+  flangeShape(D,d,df,f,t,n,proxy=False)
+  Returns the shape of one flange.
+  All the bolt holes are cut with one single boolean operation.
+    D (float): flange diameter
+    d (float): bore diameter
+    df (float): bolts holes distance
+    f (float): bolts holes diameter
+    t (float): flange thickness
+    n (int): nr. of bolts
+    proxy (bool): if True, returns a disk without holes
+  '''
+  D,d,df,f,t,n,proxy=float(D),float(d),float(df),float(f),float(t),int(n),bool(proxy)
+  def build():
+    if proxy:
+      return Part.makeCylinder(D/2,t)
+    base=Part.Face(Part.Wire(Part.makeCircle(D/2)))
+    holes=list()
+    if d>0:
+      holes.append(Part.Face(Part.Wire(Part.makeCircle(d/2))))
+    if n>0:
+      hole=Part.Face(Part.Wire(Part.makeCircle(f/2,FreeCAD.Vector(df/2,0,0),FreeCAD.Vector(0,0,1))))
+      hole.rotate(FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1),360.0/n/2)
+      for i in list(range(n)):
+        holes.append(hole.copy())
+        hole.rotate(FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1),360.0/n)
+    if holes:
+      base=base.cut(Part.makeCompound(holes))
+    return base.extrude(FreeCAD.Vector(0,0,t))
+  cache=getCache('Flange')
+  return cache.get(cache.key(D,d,df,f,t,n,proxy),build)
+
+def capShape(OD,thk,proxy=False):
+  '''
+  capShape(OD,thk,proxy=False)
+  Returns the shape of one cap.
+    OD (float): outside diameter
+    thk (float): wall thickness
+    proxy (bool): if True, returns the solid cylinder with the spherical
+      dome, without fillet and thickness
+  '''
+  D,s,proxy=float(OD),float(thk),bool(proxy)
+  def build():
+    sfera=Part.makeSphere(0.8*D,FreeCAD.Vector(0,0,-(0.55*D-6*s)))
+    if proxy:
+      return sfera.common(Part.makeCylinder(D/2,0.25*D+6*s))
+    cilindro=Part.makeCylinder(D/2,D*1.7,FreeCAD.Vector(0,0,-(0.55*D-6*s+1)),FreeCAD.Vector(0,0,1))
+    common=sfera.common(cilindro)
+    fil=common.makeFillet(D/6.5,common.Edges)
+    cut=fil.cut(Part.makeCylinder(D*1.1,D*2,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,-1)))
+    return cut.makeThickness([f for f in cut.Faces if type(f.Surface)==Part.Plane],-s,1.e-3)
+  cache=getCache('Cap')
+  return cache.get(cache.key(D,s,proxy),build)
+
+def warmUpCaps(fileNames=None):
+  '''
+  warmUpCaps(fileNames=None)
+  Builds in advance the shapes of all the caps listed in the tables
+  fileNames (default: all the "Cap_*.csv" in ./tables).
+  It runs at the loading of the workbench if WarmUpCaps is True in preferences.
+  '''
+  import catalog
+  from os.path import join
+  if not fileNames:
+    fileNames=[catalog.fileName('Cap',PRating) for PRating in catalog.ratings('Cap')]
+  for fileName in fileNames:
+    for row in catalog.getTable(join(catalog.tablesDir,fileName)).values:
+      try:
+        OD,thk=row['OD'],row['thk']
+        if thk>OD/2: thk=OD/2.1
+        capShape(OD,thk)
+      except:
+        FreeCAD.Console.PrintError('Cap %s of %s not valid\n' %(row.get('PSize'),fileName))
+
+def reductShape(OD,OD2,thk,thk2,H,conc=True,proxy=False):
+  '''
+  reductShape(OD,OD2,thk,thk2,H,conc=True,proxy=False)
+  Returns the shape of one reduction.
+    OD, OD2 (float): major and minor outside diameters
+    thk, thk2 (float): major and minor wall thickness
+    H (float): length
+    conc (bool): True for a concentric reduction, False for eccentric
+    proxy (bool): if True, returns the solid without the bore
+  '''
+  OD,OD2,thk,thk2,H,conc,proxy=float(OD),float(OD2),float(thk),float(thk2),float(H),bool(conc),bool(proxy)
+  def build():
+    if conc and proxy:
+      return Part.makeCone(OD/2,OD2/2,H)
+    if conc:
+      return Part.makeCone(OD/2,OD2/2,H).cut(Part.makeCone(OD/2-thk,OD2/2-thk2,H))
+    C=Part.makeCircle(OD/2,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1))
+    c=Part.makeCircle(OD2/2,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1))
+    c.translate(FreeCAD.Vector((OD-OD2)/2,0,H))
+    sol=Part.makeLoft([c,C],True)
+    if proxy:
+      return sol
+    C=Part.makeCircle(OD/2-thk,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1))
+    c=Part.makeCircle(OD2/2-thk2,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1))
+    c.translate(FreeCAD.Vector((OD-OD2)/2,0,H))
+    return sol.cut(Part.makeLoft([c,C],True))
+  cache=getCache('Reduct')
+  return cache.get(cache.key(OD,OD2,thk,thk2,H,conc,proxy),build)
+
+def valveShape(OD,H,ball=True,proxy=False):
+  '''
+  valveShape(OD,H,ball=True,proxy=False)
+  Returns the shape of one valve.
+    OD (float): outside diameter
+    H (float): length
+    ball (bool): True to add the sphere of the body (ball and globe valves)
+    proxy (bool): if True, returns the two cones, not fused
+  '''
+  OD,H,ball,proxy=float(OD),float(H),bool(ball),bool(proxy)
+  def build():
+    c=Part.makeCone(OD/2,OD/5,H/2)
+    if proxy:
+      return Part.makeCompound([c,c.mirror(FreeCAD.Vector(0,0,H/2),FreeCAD.Vector(0,0,1))])
+    v=c.fuse(c.mirror(FreeCAD.Vector(0,0,H/2),FreeCAD.Vector(0,0,1)))
+    if ball:
+      r=min(H*0.45,OD/2)
+      v=v.fuse(Part.makeSphere(r,FreeCAD.Vector(0,0,H/2)))
+    return v
+  cache=getCache('Valve')
+  return cache.get(cache.key(OD,H,ball,proxy),build)
+
+def uboltShape(C,H,d):
+  '''
+  uboltShape(C,H,d)
+  Returns the shape of one U-bolt.
+    C (float): the diameter of the U-bolt
+    H (float): the total height of the U-bolt
+    d (float): the rod diameter
+  '''
+  C,H,d=float(C),float(H),float(d)
+  def build():
+    c=Part.makeCircle(C/2,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1),0,180)
+    l1=Part.makeLine((C/2,0,0),(C/2,C/2-H,0))
+    l2=Part.makeLine((-C/2,0,0),(-C/2,C/2-H,0))
+    p=Part.Face(Part.Wire(Part.makeCircle(d/2,c.valueAt(c.FirstParameter),c.tangentAt(c.FirstParameter))))
+    path=Part.Wire([c,l1,l2])
+    return path.makePipe(p)
+  cache=getCache('Clamp')
+  return cache.get(cache.key(C,H,d),build)
+
+################ PARALLEL BUILD ###########################
+
+preset=None # the shape built by a worker, while its builder is called in buildMany()
+worker=False # True in the worker processes of buildMany()
+
+def initWorker():
+  'Initializer of the worker processes of buildMany()'
+  global worker
+  worker=True
+
+def buildBrep(task):
+  '''
+  buildBrep(task)
+  Builds the shape of task=(<name of builder>, <params>) and returns it
+  as a BREP string: it runs in the worker processes of buildMany().
+  '''
+  name,params=task
+  return globals()[name](*params).exportBrepToString()
+
+def buildMany(tasks, processes=None):
+  '''
+  buildMany(tasks, processes=None)
+  Builds the shapes of tasks [(<name of builder>, <params>), ...] in a
+  pool of processes and puts them in the caches, so that the execute()
+  of objects only copies them.
+    processes (int): nr. of processes; default BuildProcesses in preferences
+  With less than 2 processes, or where processes can't be forked, the
+  shapes are built here one after the other. So they are also with the
+  GUI up: forking a process with the threads of Qt and Coin running is
+  not safe, and spawned processes would start FreeCAD again.
+  Returns the nr. of different shapes.
+  '''
+  global preset
+  import multiprocessing
+  if processes==None:
+    processes=getParams().GetInt('BuildProcesses',0)
+  unique=OrderedDict()
+  for name,params in tasks:
+    params=tuple([float(p) if hasattr(p,'Value') else p for p in params]) # Quantity can't be pickled
+    unique.setdefault((name,paramsKey(*params)),(name,params))
+  tasks=list(unique.values())
+  ctx=multiprocessing
+  if hasattr(multiprocessing,'get_all_start_methods'):
+    if 'fork' in multiprocessing.get_all_start_methods():
+      ctx=multiprocessing.get_context('fork')
+    else:
+      processes=0 # spawned processes would start FreeCAD again
+  elif os.name!='posix':
+    processes=0
+  if FreeCAD.GuiUp:
+    processes=0
+  if processes<2 or len(tasks)<2:
+    for name,params in tasks:
+      globals()[name](*params)
+    return len(tasks)
+  processes=min(processes,len(tasks))
+  pool=ctx.Pool(processes,initWorker)
+  try:
+    breps=pool.map(buildBrep,tasks,max(1,len(tasks)//(processes*4)))
+  finally:
+    pool.close()
+    pool.join()
+  for task,brep in zip(tasks,breps):
+    shape=Part.Shape()
+    shape.importBrepFromString(brep)
+    preset=shape
+    try:
+      globals()[task[0]](*task[1])
+    finally:
+      preset=None
+  return len(tasks)
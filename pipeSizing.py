@@ -0,0 +1,228 @@
+#(c) 2018 R. T. LGPL: part of Flamingo tools w.b. for FreeCAD
+
+__title__="pypeTools sizing"
+__author__="oddtopus"
+__url__="github.com/oddtopus/flamingo"
+__license__="LGPL 3"
+__doc__='''
+Choice of the size of PypeLines and PypeBranches among the ones in the
+catalog, within the limits of velocity and of pressure drop per 100 m.
+The candidates are the rows of tables/Pipe_<PRating>.csv, with the bend
+radius of the same PSize in Elbow_<PRating>.csv, if any. All the
+candidates and all the Pipes and Elbows of all the lines are evaluated
+in one pass of dpCalc.losses() over arrays of shape (candidates,
+elements). Among the sizes within the limits, the lightest one (the
+smallest metal section) wins.
+The lines drawn on a polyline are evaluated along its route, with the
+pipes trimmed by the bend radius of each size: the sizes that don't fit
+the route are discarded.
+All quantities are in SI units, as in dpCalc, except the sizes of the
+catalog (mm).
+'''
+
+import FreeCAD, catalog, dpCalc, pipeRoute
+import numpy as np
+
+CANDIDATE=[('PRating','U32'),('PSize','U32'),('OD','f8'),('thk','f8'),('BR','f8'),('ID','f8')]
+RANKING=CANDIDATE+[('v','f8'),('dp100','f8'),('ok','?')]
+
+def candidates(ratings=None):
+  '''
+  candidates(ratings=None)
+  Returns the structured array of the sizes of the tables Pipe_<PRating>.csv
+  for the PRatings in the list ratings (default all of them):
+    'PRating', 'PSize', 'OD', 'thk', 'ID' (mm)
+    'BR' (mm): the bend radius in Elbow_<PRating>.csv or nan if missing
+  Rows without a positive inside diameter are skipped.
+  '''
+  rows=list()
+  for r in ratings or catalog.ratings('Pipe'):
+    for s,p in zip(catalog.rows('Pipe',r),catalog.rows('Pipe',r,numeric=True)):
+      OD,thk=p.get('OD'),p.get('thk')
+      if type(OD)!=float or type(thk)!=float or OD-2*thk<=0:
+        continue
+      e=catalog.find('Elbow',r,s['PSize'],numeric=True)
+      BR=e and type(e.get('BendRadius'))==float and e['BendRadius'] or np.nan
+      rows.append((r,s['PSize'],OD,thk,BR,OD-2*thk))
+  return np.array(rows,dtype=CANDIDATE)
+
+def lineData(line):
+  '''
+  lineData(line)
+  Returns the dictionary of the Pipes and Elbows of line:
+    'PType' (list), 'L' (m): the lengths of the pipes before trimming,
+    'trim': their trimming per unit of bend radius, 'angle' (deg) and
+    'ratio': the bend radius over OD of the elbows.
+  If the Base of line is a polyline, they are solved along its route,
+  so that each size can trim the pipes with its own bend radius,
+  otherwise they are the ones of the pieces, as they are.
+  '''
+  points=None
+  if getattr(line,'Base',None) and hasattr(line.Base,'Shape'):
+    points=pipeRoute.polyline(line.Base.Shape.Edges)
+  if points is not None:
+    try:
+      route0,route1=pipeRoute.solveRoute(points,0.),pipeRoute.solveRoute(points,1.)
+    except ValueError:
+      points=None
+  if points is None:
+    objs=[o for o in dpCalc.lineElements(line) if getattr(o,'PType','') in ['Pipe','Elbow']]
+    data=dpCalc.gather(objs)
+    OD=np.array([float(o.OD) for o in objs])/1000
+    return {'PType':data['PType'],'L':data['L'],'trim':np.zeros(len(objs)),'angle':data['angle'],'ratio':data['R']/np.where(OD>0,OD,1)}
+  n=len(route0['lengths'])
+  angles=np.asarray(route0['angles'])[np.asarray(route0['bends'],dtype=bool)]
+  zeros=np.zeros(len(angles))
+  return {'PType':['Pipe']*n+['Elbow']*len(angles),
+    'L':np.concatenate([np.asarray(route0['lengths'])/1000,zeros]),
+    'trim':np.concatenate([np.asarray(route0['lengths'])-route1['lengths'],zeros]),
+    'angle':np.concatenate([np.zeros(n),angles]),
+    'ratio':np.full(n+len(angles),float(line.BendRadius)/float(line.OD))}
+
+def evaluate(lines,Q,rho,mu,roughness=45e-6,sizes=None,method='Clamond'):
+  '''
+  evaluate(lines, Q, rho, mu, roughness=45e-6, sizes=None, method='Clamond')
+  Returns the arrays (v, dp100, fits) of shape (lines, sizes): the maximum
+  velocity (m/s) and the pressure drop of Pipes and Elbows per 100 m of
+  their center-line (Pa) of each line with each size (nan for lines
+  without Pipes) and False where some pipe of the route of the line
+  is too short for the bend radius of the size (see lineData()).
+    lines: list of PypeLines or PypeBranches
+    Q: flow (m3/s), one float or one for each line
+    sizes: the array of candidates(), default all
+  Elbows keep the ratio between bend radius and OD when their size has
+  no bend radius in the catalog.
+  '''
+  if sizes is None:
+    sizes=candidates()
+  lineDatas=[lineData(l) for l in lines]
+  counts=np.array([len(d['PType']) for d in lineDatas])
+  line=np.repeat(np.arange(len(lines)),counts)
+  data=dict([(k,np.concatenate([d[k] for d in lineDatas]+[np.zeros(0)])) for k in ['L','trim','angle','ratio']])
+  cand={'PType':sum([d['PType'] for d in lineDatas],[]),'angle':data['angle'],'Kv':np.zeros(len(line))}
+  cand['ID']=np.broadcast_to(sizes['ID'][:,None]/1000,(len(sizes),len(line)))
+  BR=sizes['BR'][:,None]/1000
+  cand['R']=np.where(np.isnan(BR),data['ratio']*sizes['OD'][:,None]/1000,BR)
+  L=data['L']-cand['R']*data['trim'] # straight length of each size
+  short=(data['trim']>0)&(L<=0)
+  cand['L']=np.maximum(L,0)
+  Lc=cand['L']+cand['R']*np.radians(data['angle']) # center-line of each size
+  Q=np.asarray(Q,dtype=float)
+  if Q.ndim:
+    Q=Q[line]
+  res=dpCalc.losses(cand,Q,rho,mu,roughness,True,method)
+  v=np.full((len(lines),len(sizes)),np.nan)
+  dp100=np.full((len(lines),len(sizes)),np.nan)
+  fits=np.ones((len(lines),len(sizes)),dtype=bool)
+  full=counts>0
+  if full.any():
+    starts=np.concatenate([[0],np.cumsum(counts)[:-1]])[full]
+    v[full]=np.maximum.reduceat(np.abs(res['v']),starts,axis=1).T
+    Ltot=np.add.reduceat(Lc,starts,axis=1)
+    dp100[full]=(np.add.reduceat(res['Dp'],starts,axis=1)/np.where(Ltot>0,Ltot,np.nan)*100).T
+    fits[full]=~np.logical_or.reduceat(short,starts,axis=1).T
+  return v, dp100, fits
+
+def rank(sizes,v,dp100,vmax=3.,dpmax=None,fits=None):
+  '''
+  rank(sizes, v, dp100, vmax=3., dpmax=None, fits=None)
+  Returns the structured array of sizes of one line, with its 'v',
+  'dp100' and 'ok', sorted from the best: first the sizes within the
+  limits vmax (m/s) and dpmax (Pa/100 m), from the lightest, then the
+  others, from the nearest to the limits. The sizes where fits is False
+  are never ok and come last.
+  '''
+  ranking=np.zeros(len(sizes),dtype=RANKING)
+  for k in sizes.dtype.names:
+    ranking[k]=sizes[k]
+  ranking['v'],ranking['dp100']=v,dp100
+  excess=v/vmax
+  if dpmax:
+    excess=np.maximum(excess,dp100/dpmax)
+  if fits is not None:
+    excess=np.where(fits,excess,np.nan)
+  excess=np.where(np.isnan(excess),np.inf,excess)
+  ranking['ok']=excess<=1
+  weight=(sizes['OD']-sizes['thk'])*sizes['thk']
+  return ranking[np.lexsort((np.where(ranking['ok'],weight,excess),~ranking['ok']))]
+
+def optimize(lines,Q,rho,mu,roughness=45e-6,vmax=3.,dpmax=None,ratings=None,apply=False,method='Clamond'):
+  '''
+  optimize(lines, Q, rho, mu, roughness=45e-6, vmax=3., dpmax=None, ratings=None, apply=False, method='Clamond')
+  Returns the list of the rankings (see rank()) of the sizes of each of
+  the lines, evaluated all together.
+    Q: flow (m3/s), one float or one for each line
+    vmax, dpmax: maximum velocity (m/s) and pressure drop (Pa/100 m)
+    ratings: the list of allowed PRatings of pipes, default all
+    apply: if True, the best size is applied to the lines that have one
+  '''
+  sizes=candidates(ratings)
+  v,dp100,fits=evaluate(lines,Q,rho,mu,roughness,sizes,method)
+  rankings=[rank(sizes,v[i],dp100[i],vmax,dpmax,fits[i]) for i in range(len(lines))]
+  if apply:
+    for l,r in zip(lines,rankings):
+      if len(r) and r[0]['ok']:
+        applySize(l,r[0],False)
+    if lines:
+      lines[0].Document.recompute()
+  return rankings
+
+def setRow(o,row):
+  'Sets the properties of o as the values of row, read from a table of catalog, except PSize and PRating'
+  for k,v in row.items():
+    if k in ['PSize','PRating'] or not hasattr(o,k) or v in [None,'']:
+      continue
+    old=getattr(o,k)
+    if isinstance(old,bool):
+      continue
+    elif isinstance(old,int):
+      setattr(o,k,int(float(v)))
+    elif isinstance(old,str):
+      setattr(o,k,v)
+    else:
+      setattr(o,k,float(v))
+
+def applySize(line,size,recompute=True):
+  '''
+  applySize(line, size, recompute=True)
+  Sets PRating, PSize, OD, thk and bend radius of the PypeLine or
+  PypeBranch line as the row size of candidates(); without a bend radius
+  in the catalog, the one of the line is scaled with the OD.
+  PypeBranches adjust their pieces by themselves, PypeLines with a Base
+  are purged and drawn again, while the Pipes and Elbows of PypeLines
+  without Base are resized in place (their lengths are not updated).
+  The other components with a PSize take the row of the new PSize in the
+  table of their PType and PRating, if any; Reducts are left as they are.
+  Returns False, leaving the line as it is, if its Base has segments too
+  short for the new bend radius.
+  '''
+  PRating,PSize=str(size['PRating']),str(size['PSize'])
+  OD,thk,BR=float(size['OD']),float(size['thk']),float(size['BR'])
+  redraw=line.PType=='PypeLine' and bool(getattr(line,'Base',None))
+  R=BR if not np.isnan(BR) else float(line.BendRadius)*OD/float(line.OD) # before OD changes
+  if redraw:
+    short=line.Proxy.check(line,R)
+    if short:
+      FreeCAD.Console.PrintWarning('%s: segments %s are too short for %s %s: not resized\n' %(line.Label,short,PRating,PSize))
+      return False
+  if line.PType=='PypeLine' and not redraw:
+    FreeCAD.Console.PrintWarning('%s has no Base: its pieces are resized but not trimmed again\n' %line.Label)
+  for o in [line]+dpCalc.lineElements(line):
+    PType=getattr(o,'PType','')
+    if o is line or (PType in ['Pipe','Elbow'] and not redraw):
+      o.PRating,o.PSize=PRating,PSize
+      if o is line or line.PType=='PypeLine': # PypeBranches pass the rest to their pieces
+        o.OD,o.thk=OD,thk
+        if hasattr(o,'BendRadius'):
+          o.BendRadius=R # after OD, that resets it to 0.75*OD
+    elif PType not in ['Pipe','Elbow','Reduct'] and getattr(o,'PSize',''):
+      row=catalog.find(PType,o.PRating,PSize)
+      if row:
+        setRow(o,row)
+        o.PSize=PSize
+  if redraw:
+    line.Proxy.purge(line)
+    line.Proxy.update(line)
+  if recompute:
+    line.Document.recompute()
+  return True